@@ -0,0 +1,219 @@
+"""Texture atlas for the images in resources/.
+
+Small images each loading as their own texture break up sprite batches.
+At startup the PNGs under resources/ are packed into a few pages, saved
+to resources/atlas/ with an index of where each image went. The pages
+are only packed again when a source image is added, removed or changed.
+
+image() stands in for ppb.Image:
+
+    SPARKLE = atlas.image("resources/sparkle1.png")
+
+It returns an AtlasRegion, which loads as its atlas page and carries the
+rect of the image on that page. The renderer combines that rect with any
+rect the sprite sets itself. Images that are not packed, such as ones too
+big for a page or missing from disk, come back as plain ppb.Image, and
+so does every image if the atlas can't be packed, in a read-only install
+for example.
+
+Run this module to repack the atlas by hand:
+
+    python atlas.py
+"""
+
+import ctypes
+import json
+import logging
+from pathlib import Path
+from time import perf_counter
+
+import ppb
+import sdl2
+from sdl2.sdlimage import IMG_Load, IMG_SavePNG
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent
+SOURCE_DIR = 'resources'
+ATLAS_DIR = 'resources/atlas'
+INDEX_FILE = 'index.json'
+
+PAGE_SIZE = 1024
+# Bigger images stay textures of their own.
+MAX_REGION = 512
+PADDING = 1
+
+# Bump when the index layout or packing changes, to force a repack.
+VERSION = 1
+
+
+class AtlasRegion:
+    """One image packed into an atlas page."""
+
+    def __init__(self, name, page, rect):
+        self.name = name
+        self.page = page
+        self.rect = rect
+
+    def __repr__(self):
+        return f"<AtlasRegion {self.name} on {self.page.name} at {self.rect}>"
+
+    def load(self, timeout=None):
+        return self.page.load(timeout)
+
+
+class AtlasError(Exception):
+    pass
+
+
+def _sources():
+    """The packable PNGs under resources/, as {name: [mtime_ns, size]}."""
+    atlas_dir = ROOT / ATLAS_DIR
+    found = {}
+    for path in sorted((ROOT / SOURCE_DIR).rglob('*.png')):
+        if atlas_dir in path.parents:
+            continue
+        stat = path.stat()
+        found[path.relative_to(ROOT).as_posix()] = [stat.st_mtime_ns, stat.st_size]
+    return found
+
+
+def load_surface(name):
+    """An image under ROOT as an RGBA32 surface that blits without blending."""
+    surface = IMG_Load(str(ROOT / name).encode('utf-8'))
+    if not surface:
+        raise AtlasError(f"Could not load {name}: {sdl2.SDL_GetError().decode('utf-8')}")
+    try:
+        # Converting turns colour keys into alpha, so blitting copies
+        # transparency along with the pixels.
+        rgba = sdl2.SDL_ConvertSurfaceFormat(surface, sdl2.SDL_PIXELFORMAT_RGBA32, 0)
+    finally:
+        sdl2.SDL_FreeSurface(surface)
+    if not rgba:
+        raise AtlasError(f"Could not convert {name}: {sdl2.SDL_GetError().decode('utf-8')}")
+    sdl2.SDL_SetSurfaceBlendMode(rgba, sdl2.SDL_BLENDMODE_NONE)
+    return rgba
+
+
+def pack(sizes, page_size=PAGE_SIZE, padding=PADDING):
+    """Place rects on pages, tallest first, in rows left to right.
+
+    sizes maps names to (w, h). Returns {name: (page, x, y, w, h)} and the
+    height used on each page.
+    """
+    placed = {}
+    heights = []
+    x = y = row_height = 0
+    page = -1
+    for name, (w, h) in sorted(sizes.items(), key=lambda item: (-item[1][1], -item[1][0], item[0])):
+        if page < 0 or x + w > page_size:
+            x, y, row_height = 0, y + row_height, 0
+        if page < 0 or y + h > page_size:
+            page += 1
+            heights.append(0)
+            x = y = row_height = 0
+        placed[name] = (page, x, y, w, h)
+        x += w + padding
+        row_height = max(row_height, h + padding)
+        heights[page] = max(heights[page], y + h)
+    return placed, heights
+
+
+def build(sources=None):
+    """Pack every source image and write the pages and index."""
+    start = perf_counter()
+    sources = _sources() if sources is None else sources
+    atlas_dir = ROOT / ATLAS_DIR
+    atlas_dir.mkdir(parents=True, exist_ok=True)
+    for old in atlas_dir.glob('page*.png'):
+        old.unlink()
+
+    surfaces = {}
+    try:
+        for name in sources:
+            surface = load_surface(name)
+            w, h = surface.contents.w, surface.contents.h
+            if w > MAX_REGION or h > MAX_REGION:
+                sdl2.SDL_FreeSurface(surface)
+            else:
+                surfaces[name] = surface
+
+        placed, heights = pack({
+            name: (s.contents.w, s.contents.h) for name, s in surfaces.items()
+        })
+
+        pages = []
+        for number, height in enumerate(heights):
+            page = sdl2.SDL_CreateRGBSurfaceWithFormat(
+                0, PAGE_SIZE, height, 32, sdl2.SDL_PIXELFORMAT_RGBA32
+            )
+            if not page:
+                raise AtlasError(f"Could not create atlas page: {sdl2.SDL_GetError().decode('utf-8')}")
+            try:
+                for name, (p, x, y, w, h) in placed.items():
+                    if p == number:
+                        sdl2.SDL_BlitSurface(surfaces[name], None, page, ctypes.byref(sdl2.SDL_Rect(x, y, w, h)))
+                filename = f"page{number}.png"
+                if IMG_SavePNG(page, str(atlas_dir / filename).encode('utf-8')) < 0:
+                    raise AtlasError(f"Could not save {filename}: {sdl2.SDL_GetError().decode('utf-8')}")
+            finally:
+                sdl2.SDL_FreeSurface(page)
+            pages.append(filename)
+    finally:
+        for surface in surfaces.values():
+            sdl2.SDL_FreeSurface(surface)
+
+    index = {
+        'version': VERSION,
+        'sources': sources,
+        'pages': pages,
+        'regions': placed,
+    }
+    (atlas_dir / INDEX_FILE).write_text(json.dumps(index, indent=1, sort_keys=True))
+    logger.info("Packed %d images into %d atlas pages in %.2fs", len(placed), len(pages), perf_counter() - start)
+    return index
+
+
+def load_index():
+    """Read the index, repacking first if the sources have changed."""
+    sources = _sources()
+    try:
+        index = json.loads((ROOT / ATLAS_DIR / INDEX_FILE).read_text())
+    except (OSError, ValueError):
+        index = None
+    if (
+        index is None
+        or index.get('version') != VERSION
+        or index.get('sources') != sources
+        or not all((ROOT / ATLAS_DIR / page).exists() for page in index['pages'])
+    ):
+        index = build(sources)
+    return index
+
+
+_regions = None
+
+def image(name):
+    """An AtlasRegion for name if it was packed, otherwise a ppb.Image."""
+    global _regions
+    if _regions is None:
+        try:
+            index = load_index()
+        except (OSError, AtlasError) as e:
+            # Say, a read-only install: the images still load on their own.
+            logger.warning("Could not pack the atlas, loading images unpacked: %s", e)
+            index = {'pages': [], 'regions': {}}
+        pages = [ppb.Image(f"{ATLAS_DIR}/{page}") for page in index['pages']]
+        _regions = {
+            source: AtlasRegion(source, pages[p], (x, y, w, h))
+            for source, (p, x, y, w, h) in index['regions'].items()
+        }
+    try:
+        return _regions[Path(name).as_posix()]
+    except KeyError:
+        return ppb.Image(name)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    build()
@@ -0,0 +1,52 @@
+"""Compare lookup-table easing against the analytic curves.
+
+Run from the repository root:
+
+    python benchmarks/easing_lut.py
+"""
+
+from pathlib import Path
+import sys
+from timeit import repeat
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import easing
+
+
+SAMPLES = 10_000
+RESOLUTIONS = (256, 1024, 4096)
+REPEAT = 50
+
+
+def best(func, number=REPEAT):
+    return min(repeat(func, number=number, repeat=5)) / number
+
+
+def main():
+    t = np.random.default_rng(0).random(SAMPLES)
+    print(f"{SAMPLES} samples per call, best of 5 runs of {REPEAT} calls\n")
+    print(f"{'easing':<12}{'mode':<14}{'usec/call':>12}{'max error':>14}")
+
+    for e in easing.EASINGS:
+        e.disable_lut()
+        exact = e.evaluate(t)
+
+        scalar = best(lambda: [e.func(x) for x in t.tolist()], number=1)
+        print(f"{e.name:<12}{'scalar loop':<14}{scalar * 1e6:>12.1f}{0.0:>14.2e}")
+
+        analytic = best(lambda: e.evaluate(t))
+        print(f"{'':<12}{'array':<14}{analytic * 1e6:>12.1f}{0.0:>14.2e}")
+
+        for resolution in RESOLUTIONS:
+            e.enable_lut(resolution)
+            error = np.max(np.abs(e.evaluate(t) - exact))
+            lut = best(lambda: e.evaluate(t))
+            print(f"{'':<12}{f'lut {resolution}':<14}{lut * 1e6:>12.1f}{error:>14.2e}")
+        e.disable_lut()
+
+
+if __name__ == '__main__':
+    main()
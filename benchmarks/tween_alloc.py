@@ -0,0 +1,119 @@
+"""Measure allocations per tween step, generic lerp against specialised paths.
+
+For each kind of value this compares one interpolation step done the old
+way, lerp() with its isinstance chain, against the interpolator() chosen
+once up front. It then steps a TweenTable full of tweens of that kind,
+which is how running tweens are interpolated now. lerp() is kept here,
+as it was in tweening.py, only as the baseline.
+
+Allocation is measured with tracemalloc as the peak number of bytes held
+above the starting point while one step runs. That includes the value
+returned or written, so the interesting part is the difference between
+paths.
+
+Run from the repository root:
+
+    python benchmarks/tween_alloc.py
+"""
+
+from pathlib import Path
+import sys
+from timeit import repeat
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import ppb
+
+from tweening import Tween, TweenTable, interpolator
+
+
+ROWS = 1000
+
+CASES = {
+    'int': (0, 255),
+    'float': (0.0, 8.0),
+    'rgb': ((64, 64, 64), (255, 0, 0)),
+    'vector': (ppb.Vector(0, 0), ppb.Vector(7, -1)),
+}
+
+
+def ilerp(f1, f2, t):
+    return int(f1 + t * (f2 - f1))
+
+def flerp(f1, f2, t):
+    return f1 + t * (f2 - f1)
+
+def vlerp(v1, v2, t):
+    return ppb.Vector(
+        v1.x + t * (v2.x - v1.x),
+        v1.y + t * (v2.y - v1.y),
+    )
+
+def tlerp(t1, t2, t):
+    assert len(t1) == len(t2)
+    return tuple(
+        lerp(i1, i2, t)
+        for (i1, i2) in zip(t1, t2)
+    )
+
+def lerp(a, b, t):
+    if isinstance(a, tuple):
+        value = tlerp(a, b, t)
+    elif isinstance(a, ppb.Vector):
+        value = vlerp(a, b, t)
+    elif isinstance(a, int):
+        value = ilerp(a, b, t)
+    else:
+        value = flerp(a, b, t)
+    return value
+
+
+class Target:
+    value = None
+
+
+def peak_bytes(func):
+    """Peak bytes allocated above the starting point while func runs."""
+    func()  # warm up caches and free lists
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak - before
+
+
+def best(func, number=2000):
+    return min(repeat(func, number=number, repeat=5)) / number
+
+
+def table_of(start, end):
+    table = TweenTable()
+    for _ in range(ROWS):
+        target = Target()
+        target.value = start
+        table.add(Tween(0.0, 1e9, target, 'value', start, end))
+    return table
+
+
+def main():
+    print(f"{'value':<8}{'path':<16}{'usec/step':>12}{'peak bytes':>12}")
+    for name, (a, b) in CASES.items():
+        f = interpolator(a, b)
+        print(f"{name:<8}{'lerp':<16}{best(lambda: lerp(a, b, 0.5)) * 1e6:>12.3f}"
+              f"{peak_bytes(lambda: lerp(a, b, 0.5)):>12}")
+        print(f"{'':<8}{'interpolator':<16}{best(lambda: f(0.5)) * 1e6:>12.3f}"
+              f"{peak_bytes(lambda: f(0.5)):>12}")
+
+        table = table_of(a, b)
+        per_row = best(lambda: table.step(0.5), number=20) / ROWS
+        print(f"{'':<8}{f'table / tween':<16}{per_row * 1e6:>12.3f}"
+              f"{peak_bytes(lambda: table.step(0.5)) // ROWS:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Pre-baked animation clips.
+
+A clip is a set of keyframe tracks, each animating one attribute. The
+tracks are sampled once, when the clip is defined, into columns of
+floats. Playing a clip then costs one ClipInstance that looks up a sample
+each frame, instead of a Tween and an easing evaluation per step:
+
+    LUNGE = Clip('lunge', [
+        Track('position', [
+            (0.0, V(0, 0)),
+            (0.1, V(-1, 0), 'in_quad'),
+            (0.3, V(0, 0), 'out_quad'),
+        ], mode=OFFSET),
+    ])
+
+    play(LUNGE, hero)
+
+Keyframes are (time, value) or (time, value, easing), the easing shaping
+the segment that ends at that keyframe. A track's mode says how its
+samples become attribute values:
+
+    ABSOLUTE  the samples are the values
+    OFFSET    the samples are offsets from wherever the attribute was,
+              layered on other tweens like an ADDITIVE tween
+    TOWARD    the samples are progress from the attribute's value when the
+              clip starts toward a target given to play()
+
+ABSOLUTE and TOWARD tracks replace running tweens on their attribute when
+the clip starts. play() can stretch a clip to another duration.
+"""
+
+from math import ceil
+
+import numpy as np
+
+import easing
+from tweening import components, interpolator, writer
+
+ABSOLUTE = 'absolute'
+OFFSET = 'offset'
+TOWARD = 'toward'
+TRACK_MODES = (ABSOLUTE, OFFSET, TOWARD)
+
+# Samples per second of clip time. Lookups pick the nearest sample.
+SAMPLE_RATE = 240
+
+
+class Track:
+    def __init__(self, attr, keyframes, mode=ABSOLUTE):
+        if mode not in TRACK_MODES:
+            raise ValueError(f"Track mode must be one of {TRACK_MODES}, not '{mode}'.")
+        if not keyframes:
+            raise ValueError(f"Track '{attr}' needs at least one keyframe.")
+        self.attr = attr
+        self.mode = mode
+        self.times = [k[0] for k in keyframes]
+        if self.times != sorted(self.times):
+            raise ValueError(f"Keyframes of track '{attr}' are out of order.")
+        self.values = [k[1] for k in keyframes]
+        self.easings = [easing.resolve(k[2] if len(k) > 2 else 'linear') for k in keyframes]
+        self.length = self.times[-1]
+
+    def sample(self, t):
+        """Evaluate the track at an array of times, one row per time."""
+        values = np.array([components(v) for v in self.values], dtype=float)
+        out = np.empty((len(t), values.shape[1]))
+        out[:] = values[0]
+        for j in range(1, len(self.times)):
+            t0, t1 = self.times[j - 1], self.times[j]
+            mask = (t >= t0) & (t <= t1)
+            if not mask.any():
+                continue
+            local = (t[mask] - t0) / (t1 - t0) if t1 > t0 else np.ones(mask.sum())
+            eased = easing.EASINGS[self.easings[j]].evaluate(local)
+            out[mask] = values[j - 1] + eased[:, None] * (values[j] - values[j - 1])
+        # Land exactly on the last keyframe.
+        out[t >= self.length] = values[-1]
+        return out
+
+
+class Clip:
+    """Keyframe tracks sampled together into a reusable animation."""
+
+    def __init__(self, name, tracks, sample_rate=SAMPLE_RATE):
+        self.name = name
+        self.tracks = tracks
+        self.length = max(track.length for track in tracks)
+        self.samples = max(2, ceil(self.length * sample_rate) + 1)
+        t = np.linspace(0.0, self.length, self.samples)
+        self.cols = [track.sample(t).T.tolist() for track in tracks]
+
+    def __repr__(self):
+        return f"<Clip {self.name} {self.length}s>"
+
+    def instance(self, target, start_time, duration=None, targets=None, group=None):
+        return ClipInstance(self, target, start_time, duration, targets or {}, group)
+
+
+class ClipInstance:
+    """One playback of a clip on a target, stepped by the TweenScheduler."""
+
+    def __init__(self, clip, target, start_time, duration, targets, group):
+        missing = [t.attr for t in clip.tracks if t.mode == TOWARD and t.attr not in targets]
+        if missing:
+            raise ValueError(f"Clip '{clip.name}' needs targets for {missing}.")
+        self.clip = clip
+        self.target = target
+        self.start_time = start_time
+        self.duration = clip.length if duration is None else duration
+        self.targets = targets
+        self.group = group
+        self.bound = None
+        self.done = False
+
+    def __repr__(self):
+        return f"<ClipInstance {self.clip.name} on {self.target!r}>"
+
+    def stop(self):
+        self.done = True
+
+    def _bind(self, table):
+        """Capture starting values, as a tween does when its delay is over."""
+        self.bound = []
+        obj = self.target
+        for track, cols in zip(self.clip.tracks, self.clip.cols):
+            key = (id(obj), track.attr)
+            value = getattr(obj, track.attr)
+            if track.mode == OFFSET:
+                state = [0.0] * len(cols)
+                self.bound.append((track, cols, key, writer(value), state))
+            else:
+                table.supersede(key)
+                if track.mode == TOWARD:
+                    f = interpolator(value, self.targets[track.attr])
+                else:
+                    f = writer(track.values[-1])
+                self.bound.append((track, cols, key, f, None))
+
+    def step(self, now, table):
+        if self.done or now < self.start_time:
+            return
+        if self.bound is None:
+            self._bind(table)
+
+        tr = (now - self.start_time) / self.duration if self.duration > 0 else 1.0
+        if tr >= 1.0:
+            tr = 1.0
+            self.done = True
+        i = int(tr * (self.clip.samples - 1) + 0.5)
+
+        obj = self.target
+        for track, cols, key, f, applied in self.bound:
+            if track.mode == OFFSET:
+                row = [col[i] for col in cols]
+                change = [v - a for v, a in zip(row, applied)]
+                applied[:] = row
+                if any(change):
+                    table.nudge(obj, track.attr, key, f, change)
+            elif track.mode == TOWARD:
+                setattr(obj, track.attr, f(cols[0][i]))
+            else:
+                setattr(obj, track.attr, f(cols, i))
@@ -0,0 +1,189 @@
+from math import ceil, floor
+from time import monotonic
+
+from ppb.events import Update
+from ppb.systemslib import System
+
+
+REALTIME = 'realtime'
+FIXED = 'fixed'
+FAST_FORWARD = 'fast_forward'
+MODES = (REALTIME, FIXED, FAST_FORWARD)
+
+
+class GameClock(System):
+    """The one clock all game timing reads from.
+
+    Game time moves in fixed steps of `step` seconds, whatever the frame
+    rate. Each frame the clock adds the time that passed to an
+    accumulator and signals an Update for every whole step in it. Game
+    time advances by a step as each Update is handled, so gameplay in
+    on_update always sees the time of its own step. A frame can run
+    several steps, or none; what is left over is alpha(), how far the
+    frame is from the last step to the next, which the renderer uses to
+    draw sprites between their last two states.
+
+    It runs in one of three modes:
+
+        realtime      steps follow the wall clock
+        fixed         one step every frame
+        fast_forward  steps follow the wall clock scaled by `speed`
+
+    No frame runs more than max_steps steps, scaled by `speed` in
+    fast_forward. Time beyond that is dropped, so a stall doesn't come
+    back as a burst of catch-up steps. Time the renderer sleeps on purpose
+    is passed to excuse() and doesn't count toward the limit, so an idle
+    scene's game time keeps up with the wall clock.
+
+    Add it first in the systems list, in place of ppb's Updater, so each
+    step's time is set before anything reads it. The renderer steps the
+    clock itself from on_idle, before it signals Render, so a frame's
+    Updates are handled before it is drawn; the clock only steps once for
+    each Idle, whichever handler gets there first. The mode can be set with
+    the engine keyword arguments `clock_mode`, `clock_step` and
+    `clock_speed`, or with configure().
+
+    Systems that schedule work register a next_due callable with watch(),
+    giving the game time their next piece of work is due, or None. The
+    renderer's frame pacing asks next_due() how long it can sleep.
+
+    Example:
+
+        GameClock.configure(mode=FIXED, step=1/60)
+        for _ in range(600):
+            GameClock.tick()   # ten seconds of game time, instantly
+    """
+
+    mode = REALTIME
+    step = 1 / 60
+    speed = 1.0
+    source = monotonic
+    max_steps = 5
+
+    current = 0.0
+    steps = 0
+    accumulated = 0.0
+    dropped = 0
+    # Wall seconds slept on purpose since the last steps were taken.
+    excused = 0.0
+    # Updates signalled but not yet handled.
+    pending = 0
+    watched = []
+    _last = None
+    _stepped = None
+
+    def __init__(self, clock_mode=None, clock_step=None, clock_speed=None, **kwargs):
+        self.configure(mode=clock_mode, step=clock_step, speed=clock_speed)
+
+    @classmethod
+    def configure(cls, mode=None, step=None, speed=None, source=None):
+        if mode is not None:
+            if mode not in MODES:
+                raise ValueError(f"Clock mode must be one of {MODES}, not '{mode}'.")
+            cls.mode = mode
+        if step is not None:
+            cls.step = step
+        if speed is not None:
+            cls.speed = speed
+        if source is not None:
+            cls.source = source
+        cls._last = None
+        cls.accumulated = 0.0
+        cls.excused = 0.0
+
+    @classmethod
+    def now(cls):
+        return cls.current
+
+    @classmethod
+    def advance(cls, seconds):
+        cls.current += seconds
+
+    @classmethod
+    def ahead(cls):
+        """Game time once the Updates already signalled are handled."""
+        return cls.current + cls.pending * cls.step
+
+    @classmethod
+    def excuse(cls, seconds):
+        """Leave seconds of wall time slept on purpose out of the step limit."""
+        cls.excused += seconds
+
+    @classmethod
+    def alpha(cls):
+        return min(cls.accumulated / cls.step, 1.0)
+
+    @classmethod
+    def watch(cls, next_due):
+        cls.watched.append(next_due)
+
+    @classmethod
+    def next_due(cls):
+        """The earliest time any watched system has work due, or None."""
+        return min(
+            (t for t in (next_due() for next_due in cls.watched) if t is not None),
+            default=None,
+        )
+
+    @classmethod
+    def real_seconds(cls, seconds):
+        """How long seconds of game time take on the wall clock."""
+        if cls.mode == FIXED:
+            # Game time only moves when frames run.
+            return 0.0
+        if cls.mode == FAST_FORWARD:
+            return seconds / cls.speed
+        return seconds
+
+    @classmethod
+    def elapsed(cls):
+        """Game time passed since the last call, going by the mode."""
+        if cls.mode == FIXED:
+            return cls.step
+        real = cls.source()
+        dt = 0.0 if cls._last is None else real - cls._last
+        cls._last = real
+        if cls.mode == FAST_FORWARD:
+            dt *= cls.speed
+        return dt
+
+    @classmethod
+    def tick(cls):
+        """Advance by the time elapsed, without stepping, for use outside the engine."""
+        dt = cls.elapsed()
+        cls.advance(dt)
+        return dt
+
+    @classmethod
+    def due_steps(cls):
+        """Take the time elapsed into the accumulator, and the whole steps out."""
+        cls.accumulated += cls.elapsed()
+        n = floor(cls.accumulated / cls.step)
+        cls.accumulated -= n * cls.step
+        scale = cls.speed if cls.mode == FAST_FORWARD else 1
+        limit = ceil((cls.max_steps + cls.excused / cls.step) * scale)
+        cls.excused = 0.0
+        if n > limit:
+            cls.dropped += n - limit
+            n = limit
+        return n
+
+    @classmethod
+    def on_idle(cls, idle, signal):
+        if idle is cls._stepped:
+            return
+        cls._stepped = idle
+        n = cls.due_steps()
+        cls.pending += n
+        for _ in range(n):
+            signal(Update(cls.step))
+
+    @classmethod
+    def on_update(cls, update, signal):
+        cls.advance(update.time_delta)
+        cls.steps += 1
+        cls.pending = max(cls.pending - 1, 0)
+
+
+now = GameClock.now
+watch = GameClock.watch
@@ -1,5 +1,8 @@
 # Easing functions
 
+import numpy as np
+
+
 def linear(t):
     return t
 
@@ -22,3 +25,97 @@ def out_bounce(t, b=0, c=1, d=1):
   else:
     t = t - (2.625 / 2.75)
     return c * (7.5625 * t * t + 0.984375) + b
+
+
+# Array versions, taking and returning NumPy arrays of progress values
+
+def linear_array(t):
+    return np.asarray(t, dtype=float)
+
+def in_quad_array(t):
+    return t * t
+
+def out_quad_array(t):
+    return t * (2 - t)
+
+def out_bounce_array(t):
+    t = np.asarray(t, dtype=float)
+    return np.select(
+        [t < 1 / 2.75, t < 2 / 2.75, t < 2.5 / 2.75],
+        [
+            7.5625 * t * t,
+            7.5625 * (t - 1.5 / 2.75) ** 2 + 0.75,
+            7.5625 * (t - 2.25 / 2.75) ** 2 + 0.9375,
+        ],
+        7.5625 * (t - 2.625 / 2.75) ** 2 + 0.984375,
+    )
+
+
+# Registry
+
+LUT_RESOLUTION = 4096
+
+
+class Easing:
+    """An easing curve that can evaluate whole arrays of progress values.
+
+    Without an array version the scalar function is vectorized, which is
+    slow but works for any curve. enable_lut() samples the curve once into
+    a table and from then on evaluates by picking the nearest sample.
+    """
+
+    def __init__(self, name, func, array_func=None):
+        self.name = name
+        self.func = func
+        self.array_func = array_func or np.vectorize(func, otypes=[float])
+        self.table = None
+
+    def __repr__(self):
+        return f"<Easing {self.name}{' lut' if self.table is not None else ''}>"
+
+    def enable_lut(self, resolution=LUT_RESOLUTION):
+        self.table = self.array_func(np.linspace(0.0, 1.0, resolution))
+
+    def disable_lut(self):
+        self.table = None
+
+    def evaluate(self, t):
+        table = self.table
+        if table is not None:
+            i = np.clip(t, 0.0, 1.0) * (len(table) - 1) + 0.5
+            return table[i.astype(np.intp)]
+        return self.array_func(t)
+
+
+EASINGS = []
+_ids = {}
+
+def register(name, func, array_func=None):
+    """Add an easing under name and return its id."""
+    _ids[name] = len(EASINGS)
+    EASINGS.append(Easing(name, func, array_func))
+    return _ids[name]
+
+def resolve(name):
+    """Return the id of a registered easing, for use with get()."""
+    try:
+        return _ids[name]
+    except KeyError:
+        raise ValueError(f"Unknown easing '{name}'.") from None
+
+def get(easing_id):
+    return EASINGS[easing_id]
+
+def enable_luts(resolution=LUT_RESOLUTION):
+    for e in EASINGS:
+        e.enable_lut(resolution)
+
+def disable_luts():
+    for e in EASINGS:
+        e.disable_lut()
+
+
+register('linear', linear, linear_array)
+register('in_quad', in_quad, in_quad_array)
+register('out_quad', out_quad, out_quad_array)
+register('out_bounce', out_bounce, out_bounce_array)
@@ -1,8 +1,8 @@
 from collections import defaultdict
 from dataclasses import dataclass
+import logging
 import math
 from random import choice, random, randint
-from time import time
 import types
 from typing import Tuple
 
@@ -13,18 +13,24 @@ from ppb.systemslib import System
 from ppb.assetlib import AssetLoadingSystem
 from ppb.systems import EventPoller
 from ppb.systems import SoundController
-from ppb.systems import Updater
 
 from events import *
-from timer import Timers, delay, repeat, cancel
-from tweening import Tweener, TweenSystem, tween
+from clock import GameClock, now as clock_now, watch
+from timer import COSMETIC, CRITICAL, SESSION, FrameBudget, Timers, delay, repeat, cancel, cancel_group
+from tweening import Tweener, TweenScheduler, TweenSystem, play, tween
+from clips import OFFSET, TOWARD, Clip, Track
+from sequence import Sequencer, start, wait
 from renderer import CustomRenderer
-from text import Text
-from menu import MenuSystem
+from sprites import LayeredScene, Sprite
+from text import Text, bake
+import atlas
+from menu import MENU_LAYER, MenuSystem
 import spells
 
 V = ppb.Vector
 
+logger = logging.getLogger(__name__)
+
 
 # Constants
 
@@ -69,11 +75,11 @@ SEED_NAMES = {
 
 # Images loaded for each color
 SEED_IMAGES = {
-    SEED_GREEN: ppb.Image("resources/seed3.png"),
-    SEED_RED: ppb.Image("resources/seed1.png"),
-    SEED_YELLOW: ppb.Image("resources/seed2.png"),
-    SEED_BLUE: ppb.Image("resources/seed5.png"),
-    SEED_VIOLET: ppb.Image("resources/seed4.png"),
+    SEED_GREEN: atlas.image("resources/seed3.png"),
+    SEED_RED: atlas.image("resources/seed1.png"),
+    SEED_YELLOW: atlas.image("resources/seed2.png"),
+    SEED_BLUE: atlas.image("resources/seed5.png"),
+    SEED_VIOLET: atlas.image("resources/seed4.png"),
 }
 
 SOUND_SWAP = ppb.Sound("resources/sound/swap.wav")
@@ -85,49 +91,49 @@ SOUND_HURT_SET = (SOUND_HURT1, SOUND_HURT2, SOUND_HURT3)
 
 ENEMIES = [
     {
-        "image": ppb.Image("resources/monster_ant.png"),
+        "image": atlas.image("resources/MONSTER_ANT.png"),
         "size": 1.0,
         "hp": 3,
         "strength": 0,
     },
     {
-        "image": ppb.Image("resources/monster_spider.png"),
+        "image": atlas.image("resources/MONSTER_SPIDER.png"),
         "size": 9.0,
         "hp": 4,
         "strength": 0,
     },
     {
-        "image": ppb.Image("resources/monster_snake.png"),
+        "image": atlas.image("resources/MONSTER_SNAKE.png"),
         "hp": 6,
         "strength": 1,
     },
     {
-        "image": ppb.Image("resources/monster_snapblossum.png"),
+        "image": atlas.image("resources/MONSTER_SNAPBLOSSUM.png"),
         "hp": 8,
         "strength": 2,
     },
     {
-        "image": ppb.Image("resources/monster_5.png"),
+        "image": atlas.image("resources/MONSTER_5.png"),
         "hp": 10,
         "strength": 1,
     },
     {
-        "image": ppb.Image("resources/monster_6.png"),
+        "image": atlas.image("resources/MONSTER_6.png"),
         "hp": 10,
         "strength": 2,
     },
     {
-        "image": ppb.Image("resources/monster_7.png"),
+        "image": atlas.image("resources/MONSTER_7.png"),
         "hp": 12,
         "strength": 1,
     },
     {
-        "image": ppb.Image("resources/monster_8.png"),
+        "image": atlas.image("resources/MONSTER_8.png"),
         "hp": 15,
         "strength": 2,
     },
     {
-        "image": ppb.Image("resources/monster_9.png"),
+        "image": atlas.image("resources/MONSTER_9.png"),
         "hp": 20,
         "strength": 3,
         "deathtime": 5.0,
@@ -137,6 +143,55 @@ ENEMIES = [
 POS_PLAYER = V(-7, -1)
 POS_ENEMY = V(7, -1)
 
+LAYER_BACKGROUND = -1
+LAYER_BAR = 50
+LAYER_BAR_SEGMENT = 51
+LAYER_HUD_TEXT = 52
+# Groups of layers the renderer keeps drawn in textures until they change.
+CACHED_LAYERS = (
+    (LAYER_BACKGROUND,),
+    (LAYER_BAR, LAYER_BAR_SEGMENT, LAYER_HUD_TEXT),
+    (MENU_LAYER, MENU_LAYER + 1),
+)
+
+# Animation clips
+
+CLIP_PLAYER_LUNGE = Clip('player-lunge', [
+    Track('position', [
+        (0.0, V(0, 0)),
+        (0.1, V(-1, 0), 'in_quad'),
+        (0.3, V(0, 0), 'out_quad'),
+    ], mode=OFFSET),
+])
+CLIP_MONSTER_LUNGE = Clip('monster-lunge', [
+    Track('position', [
+        (0.0, V(0, 0)),
+        (0.1, V(-1, 0), 'in_quad'),
+        (0.2, V(0, 0), 'out_quad'),
+    ], mode=OFFSET),
+])
+CLIP_MONSTER_HIT = Clip('monster-hit', [
+    Track('position', [
+        (0.0, V(0, 0)),
+        (0.1, V(0.25, 0), 'in_quad'),
+        (0.2, V(0, 0), 'out_quad'),
+    ], mode=OFFSET),
+])
+# A matched seed swells, then flies to its target shrinking away. Played
+# stretched to the flight time, so the swell scales with it.
+CLIP_SEED_CAST = Clip('seed-cast', [
+    Track('size', [
+        (0.0, 1.0),
+        (0.1, 1.1, 'out_quad'),
+        (0.6, 0.0, 'in_quad'),
+    ]),
+    Track('position', [
+        (0.0, 0.0),
+        (0.1, 0.0),
+        (0.6, 1.0, 'out_quad'),
+    ], mode=TOWARD),
+])
+
 
 def dist(v1, v2):
     a = abs(v1.x - v2.x) ** 2
@@ -158,6 +213,9 @@ class Sparkler:
     position: ppb.Vector
     sparkle_timer = None
 
+    def __hash__(self):
+        return hash(id(self))
+
     def spark(self, color, area=4.0):
         x = -area/2.0 + random() * area
         y = -area/2.0 + random() * area
@@ -166,12 +224,12 @@ class Sparkler:
 
     def sparkle(self, seconds, color):
         self.start_sparkle(color)
-        delay(seconds, self.stop_sparkle)
+        delay(seconds, self.stop_sparkle, group=self)
     
     def start_sparkle(self, color):
         if self.sparkle_timer:
             self.stop_sparkle()
-            self.sparkle_timer = repeat(0.01, lambda: self.spark(color))
+            self.sparkle_timer = repeat(0.01, lambda: self.spark(color), group=self, priority=COSMETIC)
     
     def stop_sparkle(self):
         if self.sparkle_timer:
@@ -207,10 +265,10 @@ class Sparkler:
             sy = sbottom + random() * (stop - sbottom)
             spos = self.position + V(sx, sy)
             tpos = self.position + V(tx, ty)
-            delay(i * step, lambda spos=spos, tpos=tpos: ParticleSystem.spawn(spos, color, tpos))
+            delay(i * step, lambda spos=spos, tpos=tpos: ParticleSystem.spawn(spos, color, tpos), group=self, priority=COSMETIC)
 
 
-class Seed(ppb.BaseSprite):
+class Seed(Sprite):
     position = V(0, 0)
 
     def __init__(self, *args, **kwargs):
@@ -244,7 +302,7 @@ class Seed(ppb.BaseSprite):
                 tween(self, 'color', COLOR_NEARBLACK, 1.0, easing='out_quad')
                 tween(self, 'size', 0.8, 1.0, easing='out_quad')
                 self.sparkle(1.0, rate=0.1)
-                delay(1.0, lambda: signal(SeedCorruptionComplete()))
+                delay(1.0, lambda: signal(SeedCorruptionComplete()), group=SESSION)
     
     @property
     def seed_type(self):
@@ -292,8 +350,8 @@ class Seed(ppb.BaseSprite):
 
     def sparkle(self, seconds, rate=0.01):
         self.stop_sparkle()
-        self.sparkle_timer = repeat(rate, self.spark)
-        delay(seconds, self.stop_sparkle)
+        self.sparkle_timer = repeat(rate, self.spark, group=self, priority=COSMETIC)
+        delay(seconds, self.stop_sparkle, group=self)
     
     def stop_sparkle(self):
         if self.sparkle_timer:
@@ -350,32 +408,66 @@ def chime(t, signal):
         def done():
             global _chime_playing
             _chime_playing = False
-        delay(t, done)
+        delay(t, done, group=SESSION)
 
 
 class TickSystem(System):
     callbacks = []
+    # ids of callbacks put off by the budget, already counted as spills.
+    spilled = set()
     game_started = False
+    budget = FrameBudget(seconds=0.002)
     
     @classmethod
-    def call_later(self, seconds, func):
-        self.callbacks.append((time() + seconds, func))
+    def call_later(self, seconds, func, priority=CRITICAL):
+        self.callbacks.append((clock_now() + seconds, func, priority))
+
+    @classmethod
+    def next_due(cls):
+        return min((c for c, _, _ in cls.callbacks), default=None)
     
     @classmethod
-    def on_start_game(cls, ev, signal):
+    def end_session(cls):
+        global _chime_playing
+        cancel_group(SESSION)
+        Sequencer.cancel_group(SESSION)
+        _chime_playing = False
         cls.callbacks = []
+        cls.spilled = set()
+
+    @classmethod
+    def on_start_game(cls, ev, signal):
+        cls.end_session()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Timers at game start:\n%s", Timers.report())
+            logger.debug("Tick callbacks: %s", cls.budget)
+            logger.debug("Tweens at game start:\n%s", TweenScheduler.report())
         cls.game_started = True
     
     @classmethod
     def on_player_death(cls, ev, signal):
+        cls.end_session()
         cls.game_started = False
 
     @classmethod
-    def on_idle(self, update, signal):
-        t = time()
+    def on_idle(cls, idle, signal):
+        cls.budget.start()
+
+    @classmethod
+    def on_update(self, update, signal):
+        t = clock_now()
         clear = []
-        for i, (c, func) in enumerate(self.callbacks):
+        for i, entry in enumerate(self.callbacks):
+            c, func, priority = entry
             if c <= t:
+                if priority == COSMETIC:
+                    if not self.budget.allows():
+                        if id(entry) not in self.spilled:
+                            self.spilled.add(id(entry))
+                            self.budget.spill()
+                        continue
+                    self.spilled.discard(id(entry))
+                    self.budget.spend()
                 func()
                 clear.append(i)
         for i in reversed(clear):
@@ -387,6 +479,9 @@ class TickSystem(System):
             signal(ToggleMenu())
 
 
+watch(TickSystem.next_due)
+
+
 @dataclass
 class GridCellError(Exception):
     x: int
@@ -449,17 +544,17 @@ class Grid:
                         x = seed.x
                         y = seed.y
                 signal(SeedCorruption(x, y))
-                delay(3, lambda: self.send_seed_corrupt(signal))
+                delay(3, lambda: self.send_seed_corrupt(signal), group=self)
         else:
-            delay(0.25, lambda: self.send_seed_corrupt(signal))
+            delay(0.25, lambda: self.send_seed_corrupt(signal), group=self)
     
     def on_scene_started(self, ev, signal):
         self.scene = ev.scene
         delay(3,
-            lambda: self.send_seed_corrupt(signal)
+            lambda: self.send_seed_corrupt(signal),
+            group=self,
         )
-        self.tweener = Tweener()
-        self.scene.add(self.tweener)
+        self.tweener = Tweener('grid')
     
     def on_start_game(self, ev, signal):
         self.frozen = False
@@ -717,23 +812,21 @@ class Grid:
                 seed.free()
                 seed.layer = 10
 
-                delay((1.0 - d), lambda seed=seed: seed.sparkle(t))
-                self.tweener.tween(seed, 'size', 1.1, 0.1, easing='out_quad', delay=1.0 - d - 0.1)
-                self.tweener.tween(seed, 'position', dest, t, easing='out_quad', delay=1.0 - d)
-                self.tweener.tween(seed, 'size', 0.0, t, easing='in_quad', delay=1.0 - d)
+                delay((1.0 - d), lambda seed=seed: seed.sparkle(t), group=SESSION)
+                self.tweener.play(CLIP_SEED_CAST, seed, delay=1.0 - d - 0.1, duration=t + 0.1, position=dest)
 
                 if attack:
-                    delay(t + (1.0 - d), lambda: signal(DamageDealt('monster', 1)))
+                    delay(t + (1.0 - d), lambda: signal(DamageDealt('monster', 1)), group=SESSION)
 
                 d *= 0.5
 
             signal(MovementStart(colors))
 
-            def _():
+            def spell_effects():
+                yield wait(d)
                 chime(t + 1.0 - d, signal)
-            delay(d, _)
 
-            def _():
+                yield wait(max(0.0, 1.0 - 2 * d + t))
                 enemy = first(self.scene.get(tag='enemy'))
 
                 if corruption:
@@ -741,7 +834,6 @@ class Grid:
                         source=(V(-2, -2), V(2, 2)),
                         target=V(0, 0),
                     )
-                    delay(1, lambda: signal(EnemyAttack(enemy, corruption)))
 
                 if dmg:
                     # signal(DamageDealt('monster', dmg))
@@ -764,7 +856,11 @@ class Grid:
                     )
                     spells.shield(3.0, player, 6)
 
-            delay(1.0-d+t, _)
+                if corruption:
+                    yield wait(1)
+                    signal(EnemyAttack(enemy, corruption))
+
+            start(spell_effects(), group=SESSION)
 
             @self.tweener.when_done
             def on_tweening_done():
@@ -804,8 +900,8 @@ class Grid:
         return seeds
 
 
-class Player(ppb.sprites.Sprite):
-    image = ppb.Image("resources/ANGELA.png")
+class Player(Sprite):
+    image = atlas.image("resources/ANGELA.png")
     size = 4.0
 
     @property
@@ -833,7 +929,7 @@ class Player(ppb.sprites.Sprite):
         self.hp = 10
 
     def on_scene_started(self, ev, signal):
-        self.hp_text = Text('', self.position + V(0, -3))
+        self.hp_text = Text('', self.position + V(0, -3), layer=LAYER_HUD_TEXT, baked=True)
         self.hp_text.scene = ev.scene
         self.hp_text.setup()
         ev.scene.add(self.hp_text)
@@ -873,12 +969,11 @@ class Player(ppb.sprites.Sprite):
                 if self.hp <= 0:
                     signal(PlayerDeath(self))
                 else:
-                    tween(self, 'position', self.position - V(1, 0), 0.1, easing='in_quad')
-                    tween(self, 'position', self.position, 0.2, delay=0.1, easing='out_quad')
+                    play(CLIP_PLAYER_LUNGE, self)
                     signal(PlaySound(choice(SOUND_HURT_SET)))
 
 
-class Monster(ppb.sprites.Sprite):
+class Monster(Sprite):
     image = ENEMIES[0]['image']
     size = ENEMIES[0]['size']
     shake = False
@@ -898,16 +993,15 @@ class Monster(ppb.sprites.Sprite):
     
     def plan_attack(self):
         pass
-        # self.next_attack = time() + randint(3, 6)
+        # self.next_attack = clock_now() + randint(3, 6)
     
     def on_enemy_attack(self, ev, signal):
         if self.hp:
             self.attack(self.strength + ev.dmg, signal)
     
     def attack(self, dmg, signal):
-        tween(self, 'position', self.position - V(1, 0), 0.1, easing='in_quad')
-        tween(self, 'position', self.position, 0.1, delay=0.1, easing='out_quad')
-        delay(0.1, lambda: signal(DamageDealt('player', dmg)))
+        play(CLIP_MONSTER_LUNGE, self)
+        delay(0.1, lambda: signal(DamageDealt('player', dmg)), group=SESSION)
         self.plan_attack()
     
     def on_start_game(self, ev, signal):
@@ -916,12 +1010,17 @@ class Monster(ppb.sprites.Sprite):
         self.strength = ENEMIES[0]["strength"]
         self.plan_attack()
 
-    def on_idle(self, ev, signal):
+    def next_due(self):
+        if self.shake:
+            return clock_now()
+        return None if self.next_attack == float('inf') else self.next_attack
+
+    def on_update(self, ev, signal):
         if self.shake:
             px, py = POS_ENEMY
-            y = math.sin(time() * 50) / 25
+            y = math.sin(clock_now() * 50) / 25
             self.position = V(px, py + y)
-        elif self.next_attack <= time():
+        elif self.next_attack <= clock_now():
             self.attack(signal)
     
     def on_movement_start(self, ev, signal):
@@ -935,7 +1034,7 @@ class Monster(ppb.sprites.Sprite):
         TickSystem.call_later(1, deal_damage)
 
     def on_scene_started(self, ev, signal):
-        self.hp_text = Text('', self.position + V(0, -3))
+        self.hp_text = Text('', self.position + V(0, -3), layer=LAYER_HUD_TEXT, baked=True)
         self.hp_text.scene = ev.scene
         self.hp_text.setup()
 
@@ -950,7 +1049,9 @@ class Monster(ppb.sprites.Sprite):
 
         self.sparkler = Sparkler(self.position)
 
-        repeat(self.smoke_rate, lambda: self.smoke())
+        cancel_group(self)
+        repeat(self.smoke_rate, lambda: self.smoke(), group=self, priority=COSMETIC)
+        watch(self.next_due)
     
     smoke_rate = 0.1
     smoke_enabled = True
@@ -962,8 +1063,7 @@ class Monster(ppb.sprites.Sprite):
 
     def on_damage_dealt(self, ev, signal):
         if ev.target == 'monster' and self.hp:
-            tween(self, 'position', self.position + V(0.25, 0), 0.1, easing='in_quad')
-            tween(self, 'position', self.position, 0.1, delay=0.1, easing='out_quad')
+            play(CLIP_MONSTER_HIT, self)
             self.hp -= ev.dmg
 
             if self.hp <= 0:
@@ -981,11 +1081,18 @@ class MonsterManager(System):
 
     def on_monster_death(self, ev, signal):
         t = ENEMIES[self.monster_index].get('deathtime', 2.0)
+        start(self.death(ev.monster, signal), group=SESSION)
 
-        delay(0.5, lambda: setattr(ev.monster, 'smoke_enabled', False))
-        delay(1.0, lambda: tween(ev.monster, 'position', POS_ENEMY + V(4, 0), 2.0, easing='out_quad'))
-        delay(3.0, lambda: setattr(ev.monster, 'smoke_enabled', True))
-        delay(3.0, lambda: signal(MonsterSpawn(ev.monster)))
+    def death(self, monster, signal):
+        yield wait(0.5)
+        monster.smoke_enabled = False
+
+        yield wait(0.5)
+        tween(monster, 'position', POS_ENEMY + V(4, 0), 2.0, easing='out_quad')
+
+        yield wait(2.0)
+        monster.smoke_enabled = True
+        signal(MonsterSpawn(monster))
     
     def on_monster_spawn(self, ev, signal):
         self.monster_index += 1
@@ -1023,9 +1130,13 @@ class EffectedImage:
 
     load = proxy_method('image', 'load')
 
+    @property
+    def rect(self):
+        return getattr(self.image, 'rect', None)
+
 
-class Particle(ppb.sprites.Sprite):
-    base_image = ppb.Image("resources/sparkle1.png")
+class Particle(Sprite):
+    base_image = atlas.image("resources/sparkle1.png")
     opacity = 128
     opacity_mode = 'add'
     color = COLOR_WHITE
@@ -1045,9 +1156,7 @@ class ParticleSystem(System):
 
     @classmethod
     def on_scene_started(cls, ev, signal):
-        t = Tweener()
-        cls.t = t
-        ev.scene.add(t)
+        cls.t = Tweener('particles')
 
         for _ in range(cls.size):
             position = V(random()*12 - 6, random()*12 - 6)
@@ -1061,6 +1170,9 @@ class ParticleSystem(System):
     def spawn(cls, pos, color, heading=None, tsize=2.5):
         s = cls.sparkles[cls.index]
         cls.index = (cls.index + 1) % cls.size
+        # The particle may still be fading out from its last spawn
+        cls.t.stop(s)
+        cancel_group(s)
         if color == COLOR_BLACK:
             s.opacity_mode = 'blend'
             s.opacity = 255
@@ -1072,9 +1184,11 @@ class ParticleSystem(System):
         s.rotation = randint(0, 260)
         s.size = 1.5
         s.layer = 100
+        # Appear where spawned, not streaking over from the last spawn
+        s.snap()
         cls.t.tween(s, 'opacity', 0, 0.5, easing='linear')
         cls.t.tween(s, 'size', tsize, 0.5, easing='linear')
-        delay(0.5, lambda: setattr(s, 'size', 0))
+        delay(0.5, lambda: setattr(s, 'size', 0), group=s, priority=COSMETIC)
         if heading:
             cls.t.tween(s, 'position', heading, 0.5, easing='linear')
 
@@ -1084,7 +1198,7 @@ class ScoreBoard(System):
     @classmethod
     def on_scene_started(cls, ev, signal):
         cls.score = 0
-        cls.text = Text(str(cls.score), V(0, 4))
+        cls.text = Text(str(cls.score), V(0, 4), layer=LAYER_HUD_TEXT, baked=True)
         ev.scene.add(cls.text)
     
     @classmethod
@@ -1105,11 +1219,11 @@ class Bar:
     value: int = 10
     max: int = 10
     size: int = 0
-    bg: ppb.Sprite = None
-    segments: Tuple[ppb.Sprite] = ()
+    bg: Sprite = None
+    segments: Tuple[Sprite] = ()
 
-    BAR_BG = ppb.Image("resources/BAR_BG.png")
-    BAR_SEGMENT = ppb.Image("resources/BAR_SEGMENT.png")
+    BAR_BG = atlas.image("resources/BAR_BG.png")
+    BAR_SEGMENT = atlas.image("resources/BAR_SEGMENT.png")
 
     def __hash__(self):
         return hash(id(self))
@@ -1117,22 +1231,22 @@ class Bar:
     def __init__(self, scene, **kwargs):
         super().__init__()
         self.__dict__.update(kwargs)
-        self.bg = ppb.Sprite(
+        self.bg = Sprite(
             position=self.position,
             image=self.BAR_BG,
             size=1/4,
-            layer=50,
+            layer=LAYER_BAR,
         )
         scene.add(self.bg)
 
         segments = []
         for i in range(16):
-            segment = ppb.Sprite(
+            segment = Sprite(
                 position=self.position + V(i/4 - 2, 0),
                 image=self.BAR_SEGMENT,
                 color=self.color,
                 size=1/4,
-                layer=51,
+                layer=LAYER_BAR_SEGMENT,
             )
             segments.append(segment)
             scene.add(segment)
@@ -1158,6 +1272,12 @@ class Bar:
 
 
 def setup(scene):
+    scene.cached_layers = CACHED_LAYERS
+
+    # The HP counters show these over and over
+    for hp in range(11):
+        bake(str(hp))
+
     for x in range(-2, 3):
         for y in range(-2, 3):
             seed_class = choice(SEEDS)
@@ -1173,26 +1293,33 @@ def setup(scene):
 
     scene.add(Grid(), tags=['grid', 'manager'])
 
-    scene.add(ppb.Sprite(
-        image=ppb.Image("resources/BACKGROUND.png"),
+    scene.add(Sprite(
+        image=atlas.image("resources/BACKGROUND.png"),
         size=12,
-        layer=-1,
+        layer=LAYER_BACKGROUND,
     ), tags=['bg'])
 
 
 ppb.run(
     setup=setup,
-    basic_systems=(CustomRenderer, Updater, EventPoller, SoundController, AssetLoadingSystem),
+    starting_scene=LayeredScene,
+    basic_systems=(CustomRenderer, EventPoller, SoundController, AssetLoadingSystem),
     systems=[
+        GameClock,
         TickSystem,
         MenuSystem,
         MonsterManager,
         TweenSystem,
         Timers,
+        Sequencer,
         ParticleSystem,
         ScoreBoard,
+        TweenScheduler,
     ],
     resolution=(1280, 720),
+    # Half the window: the 16px glyphs still land one texel to a pixel.
+    render_resolution=(640, 360),
+    frame_pacing=True,
     window_title='✨Seed Magic✨',
     target_frame_rate=60,
 )
@@ -4,6 +4,7 @@ from ppb.assets import Square
 from ppb.systemslib import System
 
 from events import *
+from sprites import Sprite
 from text import Text
 from tweening import tween
 
@@ -47,7 +48,7 @@ class MenuSystem(System):
     def on_scene_started(self, ev, signal):
 
         G = 32
-        self.bg = ppb.Sprite(
+        self.bg = Sprite(
             image=Square(G, G, G),
             size=8.0,
             layer=MENU_LAYER,
@@ -55,13 +56,13 @@ class MenuSystem(System):
         )
         ev.scene.add(self.bg)
 
-        self.title = Text('Seed Magic', V(0, 2), layer=MENU_LAYER + 1)
+        self.title = Text('Seed Magic', V(0, 2), layer=MENU_LAYER + 1, baked=True)
         ev.scene.add(self.title)
 
-        self.opt_start = Text('start', V(0, -1), layer=MENU_LAYER + 1)
+        self.opt_start = Text('start', V(0, -1), layer=MENU_LAYER + 1, baked=True)
         ev.scene.add(self.opt_start)
 
-        self.opt_quit = Text('quit', V(0, -2), layer=MENU_LAYER + 1)
+        self.opt_quit = Text('quit', V(0, -2), layer=MENU_LAYER + 1, baked=True)
         ev.scene.add(self.opt_quit)
 
         self.options = (
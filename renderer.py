@@ -1,97 +1,756 @@
 from ppb.systems import Renderer
+from ppb.systems.renderer import SmartPointer
 
 from sdl2 import (
+    SDL_BLENDFACTOR_ONE,
+    SDL_BLENDFACTOR_ONE_MINUS_SRC_ALPHA,
     SDL_BLENDMODE_ADD,
     SDL_BLENDMODE_BLEND,
+    SDL_BLENDMODE_NONE,
+    SDL_BLENDOPERATION_ADD,
+    SDL_FLIP_NONE,
+    SDL_PIXELFORMAT_ARGB8888,
+    SDL_TEXTUREACCESS_TARGET,
+    SDL_Color,
+    SDL_ComposeCustomBlendMode,
+    SDL_CreateTexture,
+    SDL_DestroyTexture,
+    SDL_RenderClear,
+    SDL_RenderCopy,
+    SDL_RenderCopyEx,
+    SDL_RenderGeometryRaw,
+    SDL_RenderPresent,
+    SDL_RenderTargetSupported,
+    SDL_ScaleModeNearest,
+    SDL_SetRenderDrawColor,
+    SDL_SetRenderTarget,
     SDL_SetTextureAlphaMod,
     SDL_SetTextureBlendMode,
     SDL_SetTextureColorMod,
+    SDL_SetTextureScaleMode,
+    SDL_WaitEventTimeout,
     SDL_QueryTexture,
     SDL_Rect,
 )
 import ppb.flags as flags
 from ppb.systems._sdl_utils import sdl_call
+from ppb.systems._utils import ObjectSideData
 
+from array import array
+from collections import Counter
 import ctypes
 import io
+from itertools import groupby
 import logging
+from math import nan
 import random
 from time import monotonic
 
+import numpy as np
 import sdl2
 import sdl2.ext
 
+from clock import GameClock, now as clock_now
 
-class CustomRenderer(Renderer):
-    last_opacity = 255
-    last_opacity_mode = 'blend'
-    last_color = (255, 255, 255)
+logger = logging.getLogger(__name__)
 
-    def prepare_resource(self, game_object):
-        texture = super().prepare_resource(game_object)
-        if texture:
-            opacity = getattr(game_object, 'opacity', 255)
-            opacity_mode = getattr(game_object, 'opacity_mode', 'blend')
-            color = getattr(game_object, 'color', (255, 255, 255))
+BLEND_MODES = {
+    'add': SDL_BLENDMODE_ADD,
+    'blend': SDL_BLENDMODE_BLEND,
+}
 
-            if True: # opacity != self.last_opacity:
-                sdl_call(
-                    SDL_SetTextureAlphaMod, texture.inner, opacity,
-                    _check_error=lambda rv: rv < 0
-                )
-                self.last_opacity = opacity
-            
-            if True: #opacity_mode != self.last_opacity_mode:
-                self.last_opacity_mode = opacity_mode
-                if opacity_mode == 'add':
-                    sdl_call(
-                        SDL_SetTextureBlendMode, texture.inner, SDL_BLENDMODE_ADD,
-                        _check_error=lambda rv: rv < 0
-                    )
-                elif opacity_mode == 'blend':
-                    sdl_call(
-                        SDL_SetTextureBlendMode, texture.inner, SDL_BLENDMODE_BLEND,
-                        _check_error=lambda rv: rv < 0
-                    )
-                else:
-                    raise ValueError(f"Support modes for translucent sprites are 'add' or 'blend', not '{opacity_mode}'.")
-            
-            if True: # color != self.last_color:
-                sdl_call(
-                    SDL_SetTextureColorMod, texture.inner, color[0], color[1], color[2],
-                    _check_error=lambda rv: rv < 0
-                )
-                self.last_color = color
 
-            return texture
-    
-    def compute_rectangles(self, texture, game_object, camera):
-        rect = getattr(game_object, 'rect', None)
+# SDL_RenderGeometry arrived in SDL 2.0.18.
+HAS_GEOMETRY = sdl2.dll.version >= 2018
+# SDL_SetTextureScaleMode arrived in SDL 2.0.12; before it, nearest
+# neighbour was the default anyway.
+HAS_SCALE_MODE = sdl2.dll.version >= 2012
+
+WHITE = (255, 255, 255)
+
+# Longest a settled scene sleeps without a wake-up, for work the clock
+# doesn't know about.
+IDLE_WAIT = 0.25
+
+FLOAT_P = ctypes.POINTER(ctypes.c_float)
+COLOR_P = ctypes.POINTER(SDL_Color)
+
+# Sprites drawn with BLEND or ADD into a cleared target leave premultiplied
+# colour behind, which is put on screen like this.
+BLENDMODE_PREMULTIPLIED = SDL_ComposeCustomBlendMode(
+    SDL_BLENDFACTOR_ONE, SDL_BLENDFACTOR_ONE_MINUS_SRC_ALPHA, SDL_BLENDOPERATION_ADD,
+    SDL_BLENDFACTOR_ONE, SDL_BLENDFACTOR_ONE_MINUS_SRC_ALPHA, SDL_BLENDOPERATION_ADD,
+)
+
+
+def _failed(rv):
+    return rv < 0
+
 
-        flags = sdl2.stdinc.Uint32()
+class TextureInfo:
+    """What the renderer knows about one texture.
+
+    The size and pixel format are queried once, when the texture is first
+    drawn; they never change after it is created. The rest is the alpha,
+    blend mode and colour last set on it.
+    """
+
+    __slots__ = ('width', 'height', 'format', 'opacity', 'opacity_mode', 'color')
+
+    def __init__(self, texture):
+        format = sdl2.stdinc.Uint32()
         access = ctypes.c_int()
-        img_w = ctypes.c_int()
-        img_h = ctypes.c_int()
+        w = ctypes.c_int()
+        h = ctypes.c_int()
+        sdl_call(
+            SDL_QueryTexture, texture.inner, ctypes.byref(format), ctypes.byref(access),
+            ctypes.byref(w), ctypes.byref(h),
+            _check_error=_failed
+        )
+        self.width = w.value
+        self.height = h.value
+        self.format = format.value
+        self.opacity = None
+        self.opacity_mode = None
+        self.color = None
+
+
+# Each sprite is read into a row of floats, in these columns.
+X, Y, SIZE, ROTATION = range(4)
+RECT = slice(4, 8)
+REGION = slice(8, 12)
+TEX_W, TEX_H = 12, 13
+RGBA = slice(14, 18)
+# The index of the sprite's texture among those gathered, times two, plus
+# its blend mode from MODE_INDEX.
+KEY = 18
+# Where the sprite was at the last clock step.
+LAST_X, LAST_Y, LAST_SIZE, LAST_ROTATION = range(19, 23)
+COLUMNS = 23
+
+MODES = ('add', 'blend')
+MODE_INDEX = {mode: i for i, mode in enumerate(MODES)}
+NO_RECT = (nan, nan, nan, nan)
+
+
+def interpolate(rows, alpha):
+    """Move rows from where they were at the last step toward where they are."""
+    for now, last in ((X, LAST_X), (Y, LAST_Y), (SIZE, LAST_SIZE)):
+        rows[:, now] = rows[:, last] + (rows[:, now] - rows[:, last]) * alpha
+    # Turn the short way round.
+    turn = (rows[:, ROTATION] - rows[:, LAST_ROTATION] + 180) % 360 - 180
+    rows[:, ROTATION] = rows[:, LAST_ROTATION] + turn * alpha
+
+
+def sprite_rects(rows, view):
+    """The source rects in the textures and destination rects on screen.
+
+    Worked out for every row at once, as (sx, sy, sw, sh) and (dx, dy, dw,
+    dh) arrays with a row per sprite, the way ppb's Renderer does it one
+    sprite at a time. view is as CustomRenderer.render_view() gives it. A
+    sprite's own rect is taken within its atlas region, if its image has
+    one.
+    """
+    left, top, pixel_ratio, _, _, scale = view
+    size = rows[:, SIZE]
+    rect = rows[:, RECT]
+    region = rows[:, REGION]
+    has_rect = ~np.isnan(rect[:, 0])
+    has_region = ~np.isnan(region[:, 0])
+
+    src = np.zeros((len(rows), 4))
+    src[:, 2] = rows[:, TEX_W]
+    src[:, 3] = rows[:, TEX_H]
+    src = np.where(has_region[:, None], region, src)
+    if has_rect.any():
+        # Clip to the region, as SDL would clip to the image's own
+        # texture, then move onto the page.
+        sx, sy, sw, sh = rect.T
+        rx, ry, rw, rh = region.T
+        x0, y0 = np.maximum(sx, 0), np.maximum(sy, 0)
+        x1, y1 = np.minimum(sx + sw, rw), np.minimum(sy + sh, rh)
+        in_region = np.stack(
+            (rx + x0, ry + y0, np.maximum(x1 - x0, 0), np.maximum(y1 - y0, 0)), axis=1
+        )
+        src = np.where(
+            has_rect[:, None], np.where(has_region[:, None], in_region, rect), src
+        )
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sw, sh = src[:, 2], src[:, 3]
+        # Renderer.target_resolution: scale so the short side is size units.
+        ratio = np.where(sw > sh, sh, sw) / (pixel_ratio * size)
+        # Sprites with rects are sized in window pixels.
+        win_w = np.where(has_rect, rect[:, 2] * size * scale, np.round(sw / ratio))
+        win_h = np.where(has_rect, rect[:, 3] * size * scale, np.round(sh / ratio))
+
+        dest = np.empty((len(rows), 4))
+        dest[:, 0] = (rows[:, X] - left) * pixel_ratio - win_w / 2
+        dest[:, 1] = (top - rows[:, Y]) * pixel_ratio - win_h / 2
+        dest[:, 2] = win_w
+        dest[:, 3] = win_h
+    return src, np.trunc(dest, out=dest)
+
+
+def on_screen(src, dest, rotation, view):
+    """Which sprites with these rects put any pixels in the viewport."""
+    dx, dy, dw, dh = dest.T
+    hw, hh = dw / 2, dh / 2
+    cx, cy = dx + hw, dy + hh
+    # Any turn stays within the circle through the corners.
+    turned = np.mod(rotation, 360) != 0
+    r = np.hypot(dw, dh) / 2
+    ex = np.where(turned, r, hw)
+    ey = np.where(turned, r, hh)
+    width, height = view[3], view[4]
+    with np.errstate(invalid='ignore'):
+        return (
+            (src[:, 2] > 0) & (src[:, 3] > 0) & (dw > 0) & (dh > 0)
+            & (cx + ex > 0) & (cx - ex < width) & (cy + ey > 0) & (cy - ey < height)
+        )
+
+
+def quads(rows, src, dest):
+    """Vertex positions, texture coordinates and colours of each sprite's quad.
+
+    Like SDL_RenderCopyEx, the source rect is clipped to the texture and
+    what is left stretched over the whole destination, turned clockwise on
+    screen about its middle. Also returns which sprites have anything of
+    their source left to draw.
+    """
+    n = len(rows)
+    tw, th = rows[:, TEX_W], rows[:, TEX_H]
+    sx, sy, sw, sh = src.T
+    u0, v0 = np.maximum(sx, 0) / tw, np.maximum(sy, 0) / th
+    u1, v1 = np.minimum(sx + sw, tw) / tw, np.minimum(sy + sh, th) / th
+
+    a = np.radians(-rows[:, ROTATION])
+    c, s = np.cos(a), np.sin(a)
+    dx, dy, dw, dh = dest.T
+    hw, hh = dw / 2, dh / 2
+    cx, cy = dx + hw, dy + hh
+    xc, xs, yc, ys = hw * c, hw * s, hh * c, hh * s
+
+    xy = np.empty((n, 4, 2), np.float32)
+    xy[:, 0, 0], xy[:, 0, 1] = cx - xc + ys, cy - xs - yc
+    xy[:, 1, 0], xy[:, 1, 1] = cx + xc + ys, cy + xs - yc
+    xy[:, 2, 0], xy[:, 2, 1] = cx + xc - ys, cy + xs + yc
+    xy[:, 3, 0], xy[:, 3, 1] = cx - xc - ys, cy - xs + yc
+
+    uv = np.empty((n, 4, 2), np.float32)
+    uv[:, 0, 0], uv[:, 0, 1] = u0, v0
+    uv[:, 1, 0], uv[:, 1, 1] = u1, v0
+    uv[:, 2, 0], uv[:, 2, 1] = u1, v1
+    uv[:, 3, 0], uv[:, 3, 1] = u0, v1
+
+    colors = np.empty((n, 4, 4), np.uint8)
+    colors[:] = rows[:, None, RGBA]
+    return xy, uv, colors, (u0 < u1) & (v0 < v1)
+
+
+class SpriteBatch:
+    """Quads from quads(), drawn a run at a time.
+
+    Each quad has four vertices with its own colour and opacity, so the
+    texture's colour and alpha modulation stay white and opaque.
+    """
+
+    def __init__(self):
+        self._arrays = None
+        self._reserve(256)
+
+    def _reserve(self, quads):
+        first = 4 * np.arange(quads, dtype=np.int32)[:, None]
+        self._indices = (first + np.array([0, 1, 2, 0, 2, 3], np.int32)).ravel()
+        self._indices_p = self._indices.ctypes.data_as(ctypes.c_void_p)
+        self._capacity = quads
+
+    def load(self, xy, uv, colors):
+        if len(xy) > self._capacity:
+            self._reserve(max(len(xy), 2 * self._capacity))
+        # Kept so the addresses stay good until the next load.
+        self._arrays = xy, uv, colors
+        self._xy, self._uv, self._colors = xy.ctypes.data, uv.ctypes.data, colors.ctypes.data
+
+    def draw(self, renderer, texture, start, end):
+        """Draw quads start to end of those loaded, which share texture."""
+        n = end - start
+        # Every quad is 4 vertices of 2 floats or 4 bytes.
+        sdl_call(
+            SDL_RenderGeometryRaw, renderer, texture.inner,
+            ctypes.cast(self._xy + 32 * start, FLOAT_P), 8,
+            ctypes.cast(self._colors + 16 * start, COLOR_P), 4,
+            ctypes.cast(self._uv + 32 * start, FLOAT_P), 8,
+            4 * n,
+            self._indices_p, 6 * n, 4,
+            _check_error=_failed
+        )
+
+
+class LayerCache:
+    """A run of cached layers drawn into a texture of their own."""
+
+    __slots__ = ('texture', 'size', 'view', 'sprites', 'interpolated')
+
+    def __init__(self, texture, size):
+        self.texture = texture
+        self.size = size
+        self.view = None
+        self.sprites = 0
+        # Drawn with sprites between steps, so only right for that frame.
+        self.interpolated = False
+
+
+class CustomRenderer(Renderer):
+    """Renderer with cached texture state and batched sprite drawing.
+
+    Each pass reads the sprites it draws into an array, a row per sprite,
+    and works out their rects, culling and quads for all of them at once
+    with NumPy; per sprite, only reading it and drawing it is left to
+    Python.
+
+    With batch_sprites (on wherever SDL supports geometry), runs of
+    sprites in layer order that share a texture and blend mode are drawn
+    with one SDL_RenderGeometryRaw call. Otherwise every sprite is its own
+    SDL_RenderCopyEx.
+
+    With cache_layers, the groups of layers a LayeredScene lists in its
+    cached_layers are drawn into target textures and copied to the screen
+    from there, until the scene's render list marks one of their layers
+    dirty or the camera moves. Renderers that can't draw to textures or
+    blend them premultiplied draw every layer every frame.
+
+    With render_resolution, such as (320, 180), the scene is drawn at that
+    size into a texture, which is then scaled up to the window by the
+    largest whole factor that fits, with nearest-neighbour filtering and
+    bars around it if need be. It should have the window's aspect ratio.
+    The camera is left alone, so mouse positions still map to the window.
+
+    With frame_pacing, the game loop sleeps between frames instead of
+    spinning, waking early for input. Frames where the scene is settled
+    are skipped: nothing in the render list is dirty or still moving
+    between steps, the camera hasn't moved, and no system watched by the
+    GameClock has work due. A settled scene sleeps until the next work
+    comes due or input arrives. The time slept is excused from the clock's
+    step limit.
+
+    Each frame the renderer steps the GameClock before it signals Render,
+    so the frame's Updates are handled before it is drawn.
+    """
+
+    def __init__(
+        self, batch_sprites=HAS_GEOMETRY, cache_layers=True, render_resolution=None,
+        frame_pacing=False, **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.batch_sprites = batch_sprites and HAS_GEOMETRY
+        self.batch = SpriteBatch()
+        self.cache_layers = cache_layers
+        self._layer_caches = {}
+        self.render_resolution = render_resolution
+        self._render_target = None
+        # What draws go to: the low resolution texture's pointer, or None
+        # for the window.
+        self._target = None
+        self._screen_rect = SDL_Rect()
+        self.frame_pacing = frame_pacing
+        self.frames_rendered = self.frames_skipped = 0
+        self._rendered_view = None
+        self.draw_calls = 0
+        self.sprites_drawn = self.sprites_culled = self.sprites_cached = 0
+        self.frame_drawn = self.frame_culled = self.frame_cached = 0
+        self.frame_interpolated = 0
+        self.cache_redraws = 0
+        # A TextureInfo per texture, living as long as the texture does.
+        self._texture_info = ObjectSideData()
+        self.state_issued = 0
+        self.state_skipped = 0
+        # SDL copies the rects it is given, so one pair serves every draw.
+        self._src_rect = SDL_Rect()
+        self._dest_rect = SDL_Rect()
+        self._src_ref = ctypes.byref(self._src_rect)
+        self._dest_ref = ctypes.byref(self._dest_rect)
+
+    def texture_info(self, texture):
+        try:
+            return self._texture_info[texture]
+        except KeyError:
+            info = self._texture_info[texture] = TextureInfo(texture)
+            return info
+
+    def __exit__(self, *exc):
+        logger.debug("Render state: %s", self.state_report())
+        logger.debug("Draws: %s", self.draw_report())
+        logger.debug("Frames: %s", self.pacing_report())
+        # Cached textures go before the renderer that owns them.
+        self._layer_caches.clear()
+        self._render_target = None
+        super().__exit__(*exc)
+
+    def state_report(self):
+        total = self.state_issued + self.state_skipped
+        return (
+            f"{self.state_issued} texture state changes issued, "
+            f"{self.state_skipped} skipped ({self.state_skipped / (total or 1):.0%})"
+        )
+
+    def pacing_report(self):
+        total = self.frames_rendered + self.frames_skipped
+        return (
+            f"{self.frames_rendered} rendered, {self.frames_skipped} skipped "
+            f"({self.frames_skipped / (total or 1):.0%})"
+        )
+
+    def draw_report(self):
+        return (
+            f"{self.sprites_drawn} sprites in {self.draw_calls} draw calls, "
+            f"{self.sprites_drawn / (self.draw_calls or 1):.1f} per call, "
+            f"{self.sprites_culled} culled, {self.sprites_cached} from "
+            f"{self.cache_redraws} cached layer draws; last frame drew "
+            f"{self.frame_drawn}, culled {self.frame_culled} and reused "
+            f"{self.frame_cached}"
+        )
+
+    def set_texture_state(self, texture, opacity, opacity_mode, color):
+        """Set alpha, blend mode and colour on texture, skipping what is already set."""
+        info = self.texture_info(texture)
+        skipped = 3
+
+        if opacity != info.opacity:
+            sdl_call(SDL_SetTextureAlphaMod, texture.inner, opacity, _check_error=_failed)
+            info.opacity = opacity
+            skipped -= 1
+
+        if opacity_mode != info.opacity_mode:
+            try:
+                mode = BLEND_MODES[opacity_mode]
+            except KeyError:
+                raise ValueError(f"Support modes for translucent sprites are 'add' or 'blend', not '{opacity_mode}'.") from None
+            sdl_call(SDL_SetTextureBlendMode, texture.inner, mode, _check_error=_failed)
+            info.opacity_mode = opacity_mode
+            skipped -= 1
+
+        if color != info.color:
+            sdl_call(
+                SDL_SetTextureColorMod, texture.inner, color[0], color[1], color[2],
+                _check_error=_failed
+            )
+            info.color = color
+            skipped -= 1
+
+        self.state_skipped += skipped
+        self.state_issued += 3 - skipped
+
+    def on_idle(self, idle_event, signal):
+        scene = idle_event.scene
+        if self.frame_pacing:
+            self.wait(scene)
+        # Signal the frame's Updates ahead of its Render, so it draws the
+        # steps alpha() was measured with.
+        GameClock.on_idle(idle_event, signal)
+        if not self.frame_pacing:
+            super().on_idle(idle_event, signal)
+            return
+
+        t = monotonic()
+        if t >= self.target_clock:
+            if self.settled(scene):
+                # Count every frame that would have been drawn while asleep.
+                self.frames_skipped += 1 + int((t - self.target_clock) / self.target_frame_length)
+                self.target_clock = t + self.target_frame_length
+            else:
+                super().on_idle(idle_event, signal)
+
+    def settled(self, scene):
+        """Whether the last frame drawn still shows the scene as it is."""
+        render_list = getattr(scene.game_objects, 'render_list', None)
+        if render_list is None or render_list.dirty or self.frame_interpolated:
+            return False
+        if self.render_view(scene.main_camera) != self._rendered_view:
+            return False
+        due = GameClock.next_due()
+        return due is None or due > GameClock.ahead()
+
+    def wait(self, scene):
+        """Sleep until the next frame, or while settled until work is due.
+
+        Input ends the wait early. The event is left queued for the
+        EventPoller.
+        """
+        timeout = self.target_clock - monotonic()
+        if self.settled(scene):
+            due = GameClock.next_due()
+            until_due = IDLE_WAIT if due is None else GameClock.real_seconds(due - clock_now())
+            timeout = max(timeout, min(until_due, IDLE_WAIT))
+        if timeout > 0:
+            start = monotonic()
+            SDL_WaitEventTimeout(None, int(timeout * 1000))
+            GameClock.excuse(monotonic() - start)
+
+    def on_render(self, render_event, signal):
+        scene = render_event.scene
+        view = self.render_view(scene.main_camera)
+
+        self.frame_drawn = self.frame_culled = self.frame_cached = 0
+        self.frame_interpolated = 0
+        if self._target is not None:
+            sdl_call(SDL_SetRenderTarget, self.renderer, self._target, _check_error=_failed)
+        self.render_background(scene)
+        render_list = getattr(scene.game_objects, 'render_list', None)
+        cached_layers = getattr(scene, 'cached_layers', ())
+        if self.cache_layers and cached_layers and render_list is not None:
+            self.render_cached(scene, view, cached_layers, render_list.dirty)
+        else:
+            self.draw_sprites(scene.sprite_layers(), view)
+        if render_list is not None:
+            render_list.dirty.clear()
+        if self._target is not None:
+            self.present_render_target()
+        sdl_call(SDL_RenderPresent, self.renderer)
+        self.sprites_drawn += self.frame_drawn
+        self.sprites_culled += self.frame_culled
+        self.sprites_cached += self.frame_cached
+        self.frames_rendered += 1
+        self._rendered_view = view
+
+    def render_view(self, camera):
+        """The (left, top, pixel ratio, width, height, scale) to draw with.
+
+        The camera's frame properties are worked out once a frame here,
+        not once per sprite. scale is pixels drawn per window pixel.
+        """
+        width, height = camera.viewport_width, camera.viewport_height
+        scale = 1
+        if self.render_resolution and self.use_render_target(width, height):
+            scale = self.render_resolution[0] / width
+            width, height = self.render_resolution
+        return (
+            camera.frame_left, camera.frame_top, camera.pixel_ratio * scale,
+            width, height, scale,
+        )
+
+    def use_render_target(self, window_width, window_height):
+        """Make the low resolution target if need be, and say if it is drawn to."""
+        if self._render_target is None:
+            width, height = self.render_resolution
+            texture = self.create_target_texture(width, height, SDL_BLENDMODE_NONE)
+            if texture is None:
+                logger.info("Drawing at window resolution instead of %dx%d.", width, height)
+                self.render_resolution = None
+                return False
+            if HAS_SCALE_MODE:
+                sdl_call(SDL_SetTextureScaleMode, texture.inner, SDL_ScaleModeNearest, _check_error=_failed)
+            self._render_target = texture
+            self._target = texture.inner
+
+        width, height = self.render_resolution
+        factor = min(window_width // width, window_height // height)
+        rect = self._screen_rect
+        if factor:
+            rect.w, rect.h = width * factor, height * factor
+        else:
+            # Smaller than the target, so squeeze it in.
+            rect.w, rect.h = window_width, window_height
+        rect.x = (window_width - rect.w) // 2
+        rect.y = (window_height - rect.h) // 2
+        return True
+
+    def present_render_target(self):
+        """Copy the low resolution target up to the window."""
+        sdl_call(SDL_SetRenderTarget, self.renderer, None, _check_error=_failed)
+        sdl_call(SDL_SetRenderDrawColor, self.renderer, 0, 0, 0, 255, _check_error=_failed)
+        sdl_call(SDL_RenderClear, self.renderer, _check_error=_failed)
         sdl_call(
-            SDL_QueryTexture, texture, ctypes.byref(flags), ctypes.byref(access),
-            ctypes.byref(img_w), ctypes.byref(img_h),
-            _check_error=lambda rv: rv < 0
+            SDL_RenderCopy, self.renderer, self._target, None, ctypes.byref(self._screen_rect),
+            _check_error=_failed
         )
+        self.draw_calls += 1
 
-        if rect:
-            src_rect = SDL_Rect(*rect)
-            win_w = rect[2] * game_object.size
-            win_h = rect[3] * game_object.size
+    def draw_sprites(self, game_objects, view):
+        if self.batch_sprites:
+            self.render_batched(game_objects, view)
         else:
-            src_rect = SDL_Rect(x=0, y=0, w=img_w, h=img_h)
-            win_w, win_h = self.target_resolution(img_w.value, img_h.value, game_object.size)
-
-        center = camera.translate_to_viewport(game_object.position)
-        dest_rect = SDL_Rect(
-            x=int(center.x - win_w / 2),
-            y=int(center.y - win_h / 2),
-            w=int(win_w),
-            h=int(win_h),
+            self.render_sprites(game_objects, view)
+
+    def render_cached(self, scene, view, cached_layers, dirty):
+        """Draw the scene, taking runs of cached layers from their textures."""
+        groups = {layer: tuple(group) for group in cached_layers for layer in group}
+        # A group split by other layers in between gets a cache per run.
+        runs = Counter()
+        layer_of = lambda game_object: groups.get(getattr(game_object, 'layer', 0))
+        for group, game_objects in groupby(scene.sprite_layers(), layer_of):
+            if group is None or not self.cache_layers:
+                self.draw_sprites(game_objects, view)
+                continue
+            key = (group, runs[group])
+            runs[group] += 1
+            cache = self._layer_caches.get(key)
+            if (
+                cache is None or cache.view != view or cache.interpolated
+                or not dirty.isdisjoint(group)
+            ):
+                cache = self.redraw_cache(key, game_objects, view)
+                if cache is None:
+                    continue
+            else:
+                self.frame_cached += cache.sprites
+            if cache.sprites:
+                sdl_call(
+                    SDL_RenderCopy, self.renderer, cache.texture.inner, None, None,
+                    _check_error=_failed
+                )
+                self.draw_calls += 1
+
+    def redraw_cache(self, key, game_objects, view):
+        """Draw game_objects into the cache for key, making it if need be.
+
+        If the renderer can't cache, layer caching is turned off, the
+        objects are drawn straight to the screen and None is returned.
+        """
+        size = view[3], view[4]
+        cache = self._layer_caches.get(key)
+        if cache is None or cache.size != size:
+            texture = self.create_target_texture(*size, BLENDMODE_PREMULTIPLIED)
+            if texture is None:
+                logger.info("Layer caching is off.")
+                self.cache_layers = False
+                self._layer_caches.clear()
+                self.draw_sprites(game_objects, view)
+                return None
+            cache = self._layer_caches[key] = LayerCache(texture, size)
+
+        sdl_call(SDL_SetRenderTarget, self.renderer, cache.texture.inner, _check_error=_failed)
+        try:
+            sdl_call(SDL_SetRenderDrawColor, self.renderer, 0, 0, 0, 0, _check_error=_failed)
+            sdl_call(SDL_RenderClear, self.renderer, _check_error=_failed)
+            drawn, interpolated = self.frame_drawn, self.frame_interpolated
+            self.draw_sprites(game_objects, view)
+            cache.sprites = self.frame_drawn - drawn
+            cache.interpolated = self.frame_interpolated > interpolated
+        finally:
+            sdl_call(SDL_SetRenderTarget, self.renderer, self._target, _check_error=_failed)
+        cache.view = view
+        self.cache_redraws += 1
+        return cache
+
+    def create_target_texture(self, width, height, blend_mode):
+        """A texture to draw to, or None if SDL can't make one."""
+        if not SDL_RenderTargetSupported(self.renderer):
+            logger.info("The renderer can't draw to textures.")
+            return None
+        texture = SDL_CreateTexture(
+            self.renderer, SDL_PIXELFORMAT_ARGB8888, SDL_TEXTUREACCESS_TARGET, width, height
         )
+        if not texture:
+            logger.info("Could not make a target texture: %s", sdl2.SDL_GetError().decode('utf-8'))
+            return None
+        texture = SmartPointer(texture, SDL_DestroyTexture)
+        if SDL_SetTextureBlendMode(texture.inner, blend_mode) < 0:
+            logger.info("Could not set a target's blend mode: %s", sdl2.SDL_GetError().decode('utf-8'))
+            return None
+        return texture
+
+    def visible_sprites(self, game_objects, view):
+        """Gather the sprites that can be seen, and their rects, into arrays.
+
+        Zero-size and fully transparent sprites are dropped before their
+        image is looked at. The rest are read into rows, moved back between
+        their last two clock steps if they changed in the last one, and
+        dropped once their rects show they are outside the viewport, before
+        any SDL call is made for them.
+
+        Returns the objects and textures gathered, and for the visible
+        sprites their rows, source and destination rects and indices into
+        objects.
+        """
+        objects = []
+        textures = {}
+        rows = array('d')
+        step = GameClock.steps
+        interpolated = 0
+        for game_object in game_objects:
+            size = game_object.size
+            opacity = getattr(game_object, 'opacity', 255)
+            if size <= 0 or opacity <= 0:
+                self.frame_culled += 1
+                continue
+            texture = self.prepare_resource(game_object)
+            if texture is None:
+                continue
+            mode = getattr(game_object, 'opacity_mode', 'blend')
+            if mode not in MODE_INDEX:
+                raise ValueError(f"Support modes for translucent sprites are 'add' or 'blend', not '{mode}'.")
+            info = self.texture_info(texture)
+            position = game_object.position
+            rotation = game_object.rotation
+            previous = getattr(game_object, '_previous', None)
+            if previous is not None and previous[0] == step:
+                _, last, last_size, last_rotation = previous
+                interpolated += 1
+            else:
+                last, last_size, last_rotation = position, size, rotation
+            color = getattr(game_object, 'color', WHITE)
+            rows.extend((
+                position.x, position.y, size, rotation,
+                *(getattr(game_object, 'rect', None) or NO_RECT),
+                *(getattr(game_object.__image__(), 'rect', None) or NO_RECT),
+                info.width, info.height,
+                color[0], color[1], color[2], opacity,
+                2 * textures.setdefault(texture, len(textures)) + MODE_INDEX[mode],
+                last.x, last.y, last_size, last_rotation,
+            ))
+            objects.append(game_object)
+
+        rows = np.frombuffer(rows, dtype=float).reshape(-1, COLUMNS)
+        if interpolated:
+            interpolate(rows, GameClock.alpha())
+            self.frame_interpolated += interpolated
+        src, dest = sprite_rects(rows, view)
+        index = np.flatnonzero(on_screen(src, dest, rows[:, ROTATION], view))
+        self.frame_culled += len(rows) - len(index)
+        self.frame_drawn += len(index)
+        return objects, list(textures), rows[index], src[index], dest[index], index
+
+    def render_sprites(self, game_objects, view):
+        objects, textures, rows, src, dest, index = self.visible_sprites(game_objects, view)
+        src_rect, dest_rect = self._src_rect, self._dest_rect
+        for i, key, rotation, s, d in zip(
+            index.tolist(), rows[:, KEY].astype(int).tolist(), rows[:, ROTATION].tolist(),
+            src.astype(int).tolist(), dest.astype(int).tolist(),
+        ):
+            game_object = objects[i]
+            texture = textures[key >> 1]
+            self.set_texture_state(
+                texture,
+                getattr(game_object, 'opacity', 255),
+                MODES[key & 1],
+                getattr(game_object, 'color', WHITE),
+            )
+            src_rect.x, src_rect.y, src_rect.w, src_rect.h = s
+            dest_rect.x, dest_rect.y, dest_rect.w, dest_rect.h = d
+            sdl_call(
+                SDL_RenderCopyEx, self.renderer, texture.inner,
+                self._src_ref, self._dest_ref, -rotation, None, SDL_FLIP_NONE,
+                _check_error=_failed
+            )
+            self.draw_calls += 1
+
+    def render_batched(self, game_objects, view):
+        _, textures, rows, src, dest, _ = self.visible_sprites(game_objects, view)
+        xy, uv, colors, keep = quads(rows, src, dest)
+        if not keep.all():
+            xy, uv, colors, rows = xy[keep], uv[keep], colors[keep], rows[keep]
+        if not len(rows):
+            return
+
+        # Runs of sprites in a row that share a texture and blend mode.
+        self.batch.load(xy, uv, colors)
+        keys = rows[:, KEY].astype(int)
+        starts = [0, *(np.flatnonzero(keys[1:] != keys[:-1]) + 1).tolist()]
+        for start, end, key in zip(starts, starts[1:] + [len(keys)], keys[starts].tolist()):
+            self.draw_batch(textures[key >> 1], MODES[key & 1], start, end)
 
-        return src_rect, dest_rect, ctypes.c_double(-game_object.rotation)
\ No newline at end of file
+    def draw_batch(self, texture, opacity_mode, start, end):
+        self.set_texture_state(texture, 255, opacity_mode, WHITE)
+        self.draw_calls += 1
+        self.batch.draw(self.renderer, texture, start, end)
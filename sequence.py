@@ -0,0 +1,166 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from heapq import heappop, heappush
+from itertools import count
+from types import FunctionType, GeneratorType
+from typing import Hashable, Optional
+
+from ppb.systemslib import System
+
+from clock import now as clock_now, watch
+
+
+@dataclass
+class Wait:
+    seconds: float
+
+
+@dataclass
+class Until:
+    predicate: FunctionType
+
+
+def wait(seconds):
+    """Resume the sequence after a number of seconds."""
+    return Wait(seconds)
+
+def until(predicate):
+    """Resume the sequence on the first step predicate() is true."""
+    return Until(predicate)
+
+def tween_done(tweener):
+    """Resume the sequence once the tweener has nothing left to do."""
+    return Until(lambda: not tweener.is_tweening)
+
+
+class Sequence:
+    """A running generator, suspended on whatever it last yielded."""
+
+    def __init__(self, gen: GeneratorType, group: Optional[Hashable] = None):
+        self.gen = gen
+        self.group = group
+        self.done = False
+
+    def __hash__(self):
+        return hash(id(self))
+
+    def cancel(self):
+        Sequencer.cancel(self)
+
+
+class Sequencer(System):
+    """Runs gameplay sequences written as generators.
+
+    Instead of chaining delay() closures, write the steps in order and
+    yield what to wait for between them:
+
+        def death(monster):
+            yield wait(0.5)
+            monster.smoke_enabled = False
+            yield tween_done(tweener)
+            signal(MonsterSpawn(monster))
+
+        start(death(monster), group=SESSION)
+
+    A sequence runs up to its first yield as soon as it is started. Yielding
+    None resumes on the next step. Each sequence is one object however
+    many steps it has; cancelling it, or its group, stops it for good.
+    """
+
+    queue = []
+    waiting = []
+    groups = defaultdict(set)
+    _order = count()
+
+    @classmethod
+    def start(cls, gen, group=None):
+        seq = Sequence(gen, group)
+        cls.groups[group].add(seq)
+        cls._resume(seq)
+        return seq
+
+    @classmethod
+    def cancel(cls, seq):
+        if not seq.done:
+            seq.done = True
+            seq.gen.close()
+            cls._discard(seq)
+
+    @classmethod
+    def cancel_group(cls, group):
+        """Cancel every running sequence in a group, returning how many there were."""
+        seqs = cls.groups.pop(group, ())
+        for seq in seqs:
+            seq.done = True
+            seq.gen.close()
+        return len(seqs)
+
+    @classmethod
+    def _discard(cls, seq):
+        seqs = cls.groups.get(seq.group)
+        if seqs is not None:
+            seqs.discard(seq)
+            if not seqs:
+                del cls.groups[seq.group]
+
+    @classmethod
+    def _resume(cls, seq):
+        while not seq.done:
+            try:
+                command = seq.gen.send(None)
+            except StopIteration:
+                seq.done = True
+                cls._discard(seq)
+                return
+
+            if command is None:
+                command = Wait(0)
+            if isinstance(command, Wait):
+                heappush(cls.queue, (clock_now() + command.seconds, next(cls._order), seq))
+                return
+            elif isinstance(command, Until):
+                if not command.predicate():
+                    cls.waiting.append((command.predicate, seq))
+                    return
+            else:
+                raise TypeError(f"Sequences yield wait(), until() or None, not {command!r}.")
+
+    @classmethod
+    def next_due(cls):
+        if cls.waiting:
+            cls.waiting = [entry for entry in cls.waiting if not entry[1].done]
+            if cls.waiting:
+                # until() predicates are checked every step.
+                return clock_now()
+        queue = cls.queue
+        while queue and queue[0][2].done:
+            heappop(queue)
+        return queue[0][0] if queue else None
+
+    @classmethod
+    def on_update(cls, update, signal):
+        now = clock_now()
+
+        # Collect before resuming, so anything a sequence yields now waits
+        # for the next step at the earliest.
+        ready = []
+        while cls.queue and cls.queue[0][0] <= now:
+            ready.append(heappop(cls.queue)[2])
+
+        waiting = cls.waiting
+        cls.waiting = []
+        for predicate, seq in waiting:
+            if seq.done:
+                continue
+            if predicate():
+                ready.append(seq)
+            else:
+                cls.waiting.append((predicate, seq))
+
+        for seq in ready:
+            cls._resume(seq)
+
+
+start = Sequencer.start
+
+watch(Sequencer.next_due)
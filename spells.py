@@ -1,48 +1,47 @@
 from math import floor
-from time import perf_counter
 
-from timer import delay
+from clock import now as clock_now
+from sequence import start, wait
+from timer import SESSION
 
 
 def heal(duration, target, hp):
     """Heal the target an amount of HP over a number of seconds."""
 
-    start = perf_counter()
-    end = start + duration
+    end = clock_now() + duration
     d = floor(hp / duration)
 
-    def tick():
-        nonlocal hp
-        hp -= d
-        if target.hp >= d:
-            target.hp += d
+    def ticks(hp):
+        while True:
+            yield wait(1.0)
+            hp -= d
+            if target.hp >= d:
+                target.hp += d
 
-        if perf_counter() > end:
-            if hp > 0:
-                target.hp += hp
-        else:
-            delay(1.0, tick)
+            if clock_now() > end:
+                if hp > 0:
+                    target.hp += hp
+                return
 
-    delay(1.0, tick)
+    return start(ticks(hp), group=SESSION)
 
 
 def shield(duration, target, hp):
     """Reduce incoming damage by a certain amount over a number of seconds."""
 
-    start = perf_counter()
-    end = start + duration
+    end = clock_now() + duration
     d = floor(hp / duration)
 
-    def tick():
-        nonlocal hp
-        hp -= d
-        if target.hp >= d:
-            target.shield += d
+    def ticks(hp):
+        while True:
+            yield wait(1.0)
+            hp -= d
+            if target.hp >= d:
+                target.shield += d
 
-        if perf_counter() > end:
-            if hp > 0:
-                target.shield += hp
-        else:
-            delay(1.0, tick)
+            if clock_now() > end:
+                if hp > 0:
+                    target.shield += hp
+                return
 
-    delay(1.0, tick)
+    return start(ticks(hp), group=SESSION)
@@ -0,0 +1,173 @@
+"""Sprites and a scene that keep their draw order up to date as they change.
+
+ppb sorts every object in the scene by layer on every frame to find the
+draw order. A LayeredScene instead keeps its objects in a RenderList,
+sorted once when they are added. Sprites built on the Sprite class here
+tell the list when their layer changes, so it only moves them, and
+nothing is sorted per frame.
+
+The list also notes which layers changed since the renderer last looked:
+a layer is dirty when an object joins, leaves or moves to it, or when a
+tracked sprite on it has one of its WATCHED attributes assigned. The
+renderer uses this to redraw cached layers only when they change.
+
+Tracked sprites also keep their position, size and rotation from before
+the first change in each clock step, so the renderer can draw them
+between their last two steps. snap() drops that for a sprite that jumps.
+
+Objects that are not tracked sprites, like Text or Grid, are placed by the
+layer they have when added and are expected to keep it.
+"""
+
+from bisect import bisect, bisect_left
+from itertools import count
+
+import ppb
+from ppb.scenes import GameObjectCollection
+
+from clock import GameClock
+
+# Attributes that change how a sprite looks.
+WATCHED = frozenset({
+    'position', 'size', 'image', 'rect', 'rotation',
+    'color', 'opacity', 'opacity_mode',
+})
+# Watched attributes drawn between their values at the last two steps.
+INTERPOLATED = frozenset({'position', 'size', 'rotation'})
+
+
+class RenderList:
+    """Objects in ascending layer order, and in the order added within a layer."""
+
+    def __init__(self):
+        self.keys = []
+        self.items = []
+        self.where = {}
+        self.dirty = set()
+        self._order = count()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items[:])
+
+    def _insert(self, obj, key):
+        i = bisect(self.keys, key)
+        self.keys.insert(i, key)
+        self.items.insert(i, obj)
+        self.where[obj] = key
+        self.dirty.add(key[0])
+
+    def _delete(self, obj):
+        key = self.where.pop(obj)
+        i = bisect_left(self.keys, key)
+        del self.keys[i]
+        del self.items[i]
+        self.dirty.add(key[0])
+        return key
+
+    def add(self, obj):
+        self._insert(obj, (getattr(obj, 'layer', 0), next(self._order)))
+
+    def remove(self, obj):
+        self._delete(obj)
+
+    def move(self, obj, layer):
+        """Put obj in its place for a new layer, keeping its order within layers."""
+        if obj in self.where:
+            _, order = self._delete(obj)
+            self._insert(obj, (layer, order))
+
+    def changed(self, obj):
+        """Mark the layer of obj dirty."""
+        key = self.where.get(obj)
+        if key is not None:
+            self.dirty.add(key[0])
+
+
+class LayeredCollection(GameObjectCollection):
+    """A GameObjectCollection that also keeps a RenderList."""
+
+    def __init__(self):
+        super().__init__()
+        self.render_list = RenderList()
+
+    def add(self, game_object, tags=()):
+        if game_object in self.all:
+            # Adding again only adds tags, as in GameObjectCollection.
+            super().add(game_object, tags)
+            return
+        super().add(game_object, tags)
+        self.render_list.add(game_object)
+        if isinstance(game_object, Tracked):
+            game_object._render_lists += (self.render_list,)
+
+    def remove(self, game_object):
+        super().remove(game_object)
+        self.render_list.remove(game_object)
+        if isinstance(game_object, Tracked):
+            game_object._render_lists = tuple(
+                r for r in game_object._render_lists if r is not self.render_list
+            )
+
+
+class LayeredScene(ppb.BaseScene):
+    """A scene drawn from a RenderList.
+
+    cached_layers is a sequence of groups of layers, such as
+    [(-1,), (50, 51)]. The renderer keeps each group drawn in a texture of
+    its own and only redraws it when one of its layers is dirty.
+    """
+
+    container_class = LayeredCollection
+    cached_layers = ()
+
+    def sprite_layers(self):
+        return iter(self.game_objects.render_list)
+
+
+class Tracked:
+    """Mixin for sprites that tell their render lists when they change.
+
+    Changing layer moves the sprite in its lists; assigning any WATCHED
+    attribute marks its layer dirty. Put it before the ppb sprite class,
+    and don't shadow layer with a class attribute in subclasses; pass
+    layer= or set it in __init__ instead.
+    """
+
+    _layer = 0
+    _render_lists = ()
+    # (step, position, size, rotation) from before the step's first change.
+    _previous = None
+
+    @property
+    def layer(self):
+        return self._layer
+
+    @layer.setter
+    def layer(self, value):
+        if value != self._layer:
+            self._layer = value
+            for render_list in self._render_lists:
+                render_list.move(self, value)
+
+    def __setattr__(self, name, value):
+        if name in WATCHED and self._render_lists:
+            if name in INTERPOLATED:
+                previous = self._previous
+                if previous is None or previous[0] != GameClock.steps:
+                    self._previous = (GameClock.steps, self.position, self.size, self.rotation)
+            super().__setattr__(name, value)
+            for render_list in self._render_lists:
+                render_list.changed(self)
+        else:
+            super().__setattr__(name, value)
+
+    def snap(self):
+        """Draw the sprite where it is now, not on its way from where it was."""
+        self._previous = None
+
+
+class Sprite(Tracked, ppb.Sprite):
+    pass
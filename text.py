@@ -1,7 +1,15 @@
+from functools import lru_cache
+import ctypes
+
 import ppb
+from ppb.assetlib import AbstractAsset
+import sdl2
 
+import atlas
+from sprites import Sprite
 
-FONTSHEET = ppb.Image("resources/sonic_asalga.png")
+FONT = "resources/sonic_asalga.png"
+FONTSHEET = atlas.image(FONT)
 LEGEND = """ !"#$%&'
 <>*+,-./
 01234567
@@ -16,7 +24,22 @@ pqrstuvw
 xyz{|}~
 """
 
-class Letter(ppb.Sprite):
+# The rect of each character's glyph in FONTSHEET. Where a character is in
+# the legend twice, the later one is used.
+GLYPHS = {
+    char: (x*16, y*16, 16, 16)
+    for y, row in enumerate(LEGEND.split('\n'))
+    for x, char in enumerate(row)
+}
+GLYPH_SIZE = 16
+# How many baked strings are kept for reuse.
+BAKED_STRINGS = 64
+
+# Font sheets loaded for baking, by name.
+_sheets = {}
+
+
+class Letter(Sprite):
     image = FONTSHEET
     rect = (0, 0, 16, 16)
     size = 2
@@ -24,18 +47,91 @@ class Letter(ppb.Sprite):
     def __init__(self, char):
         super().__init__()
         self.char = char
-        for y, row in enumerate(LEGEND.split('\n')):
-            for x, col in enumerate(row):
-                if char in col:
-                    self.rect = (x*16, y*16, 16, 16)
+
+    @property
+    def char(self):
+        return self._char
+
+    @char.setter
+    def char(self, value):
+        self._char = value
+        self.rect = GLYPHS.get(value, Letter.rect)
+
+
+class BakedText(AbstractAsset):
+    """A string drawn from a font sheet into an image of its own."""
+
+    _surface = None
+
+    def __init__(self, text, font=FONT):
+        self.text = text
+        self.font = font
+        try:
+            sheet = _sheets[font]
+        except KeyError:
+            sheet = _sheets[font] = atlas.load_surface(font)
+        self._surface = sdl2.SDL_CreateRGBSurfaceWithFormat(
+            0, GLYPH_SIZE * len(text), GLYPH_SIZE, 32, sdl2.SDL_PIXELFORMAT_RGBA32
+        )
+        if not self._surface:
+            raise atlas.AtlasError(f"Could not bake {text!r}: {sdl2.SDL_GetError().decode('utf-8')}")
+        for i, char in enumerate(text):
+            sdl2.SDL_BlitSurface(
+                sheet, ctypes.byref(sdl2.SDL_Rect(*GLYPHS.get(char, Letter.rect))),
+                self._surface, ctypes.byref(sdl2.SDL_Rect(i * GLYPH_SIZE, 0, GLYPH_SIZE, GLYPH_SIZE)),
+            )
+
+    def __repr__(self):
+        return f"<BakedText {self.text!r} in {self.font}>"
+
+    def load(self):
+        return self._surface
+
+    def __del__(self, _SDL_FreeSurface=sdl2.SDL_FreeSurface):
+        if self._surface:
+            _SDL_FreeSurface(self._surface)
+
+
+@lru_cache(maxsize=BAKED_STRINGS)
+def bake(text, font=FONT):
+    """A BakedText for text, reused while it is among the most recently baked."""
+    return BakedText(text, font)
+
+
+class Label(Sprite):
+    """One sprite showing a whole BakedText."""
+
+    size = 2
+
+    def show(self, image):
+        self.image = image
+        self.rect = (0, 0, GLYPH_SIZE * len(image.text), GLYPH_SIZE)
+
 
 class Text:
-    def __init__(self, text, position, layer=100, align='center'):
+    """A line of text, drawn as Letter sprites or baked into one Label.
+
+    Setting text only touches the letters that differ from what is shown:
+    changed characters have their glyph swapped, and letters move only
+    when the length changes the alignment. Letters no longer needed are
+    taken out of the scene and kept for reuse. Setting the text already
+    shown does nothing.
+
+    With baked=True the whole string is drawn into one image from the
+    bake() cache instead, and shown on a single Label, so a line costs
+    one sprite however long it is.
+    """
+
+    def __init__(self, text, position, layer=100, align='center', baked=False):
         self.position = position
         self.layer = layer
         self.align = align
+        self.baked = baked
+        self.label = None
         self.signal = None
         self.letters = []
+        self.spare = []
+        self.shown = None
         self._text = text
         self._size = 2
     
@@ -62,18 +158,19 @@ class Text:
         self._size = value
         for l in self.letters:
             l.size = value
+        if self.label is not None:
+            self.label.size = value
 
     @text.setter
     def text(self, value):
         self._text = value
-        for l in self.letters:
-            self.scene.remove(l)
-        self.letters.clear()
-        
+        if value == self.shown:
+            return
+
         p = self.position
 
         if self.align == 'center':
-            align = -0.25 * len(self.text)
+            align = -0.25 * len(value)
         elif self.align == 'left':
             raise NotImplementedError()
         elif self.align == 'right':
@@ -81,9 +178,54 @@ class Text:
         else:
             raise ValueError()
 
-        for i, c in enumerate(self.text):
-            l = Letter(c)
-            l.layer = self.layer
-            l.position = ppb.Vector(p.x + i/2 + align, p.y)
-            self.scene.add(l)
-            self.letters.append(l)
+        if self.baked:
+            self.show_label(value, p.x + align - 0.25 + len(value) / 4)
+        else:
+            self.show_letters(value, p.x + align)
+        self.shown = value
+
+    def show_label(self, value, x):
+        if self.label is None:
+            self.label = Label(layer=self.layer, size=self._size)
+        label = self.label
+        if not value:
+            if label in self.scene:
+                self.scene.remove(label)
+            return
+        label.show(bake(value))
+        position = ppb.Vector(x, self.position.y)
+        if label.position != position:
+            label.position = position
+            label.snap()
+        if label not in self.scene:
+            self.scene.add(label)
+
+    def show_letters(self, value, left):
+        p = self.position
+        letters = self.letters
+        while len(letters) > len(value):
+            l = letters.pop()
+            self.scene.remove(l)
+            self.spare.append(l)
+
+        for i, c in enumerate(value):
+            position = ppb.Vector(left + i/2, p.y)
+            if i < len(letters):
+                l = letters[i]
+                if l.char != c:
+                    l.char = c
+                if l.position != position:
+                    l.position = position
+                    l.snap()
+            else:
+                if self.spare:
+                    l = self.spare.pop()
+                    l.char = c
+                else:
+                    l = Letter(c)
+                l.layer = self.layer
+                l.size = self._size
+                l.position = position
+                l.snap()
+                self.scene.add(l)
+                letters.append(l)
@@ -1,11 +1,74 @@
+from collections import defaultdict
 from dataclasses import dataclass
-from time import monotonic
+from heapq import heappop, heappush
+from itertools import count
+from math import floor
+from time import perf_counter
 from types import FunctionType
-from typing import Optional
+from typing import Hashable, Optional
 
 import ppb
 from ppb.systemslib import System
 
+from clock import now as clock_now, watch
+
+# Group for timers that belong to one play-through and die with it.
+SESSION = 'session'
+
+# How a repeating timer catches up after missing ticks:
+#   SKIP      fire once, drop the missed ticks
+#   COALESCE  fire once, passing the number of missed ticks to the callback
+#   BURST     fire once per missed tick, up to max_burst times
+SKIP = 'skip'
+COALESCE = 'coalesce'
+BURST = 'burst'
+CATCHUP_POLICIES = (SKIP, COALESCE, BURST)
+
+# Priority classes. CRITICAL callbacks always run in the step they are due;
+# COSMETIC ones run while the frame's budget lasts and spill into later steps.
+CRITICAL = 0
+COSMETIC = 1
+
+
+class FrameBudget:
+    """A per-frame allowance of wall time and calls for cosmetic callbacks.
+
+    Call start() at the top of a frame, then check allows() before each
+    cosmetic callback and spend() after it. Call spill() when a callback is
+    first put off, not again for each step it stays put off.
+    """
+
+    def __init__(self, seconds=0.004, count=None):
+        self.seconds = seconds
+        self.count = count
+        self.deadline = 0.0
+        self.used = 0
+        self.spilled = 0
+        self.spill_frames = 0
+        self._spilled_this_frame = False
+
+    def start(self):
+        self.deadline = perf_counter() + self.seconds
+        self.used = 0
+        self._spilled_this_frame = False
+
+    def allows(self):
+        if self.count is not None and self.used >= self.count:
+            return False
+        return perf_counter() < self.deadline
+
+    def spend(self):
+        self.used += 1
+
+    def spill(self):
+        self.spilled += 1
+        if not self._spilled_this_frame:
+            self._spilled_this_frame = True
+            self.spill_frames += 1
+
+    def __str__(self):
+        return f"{self.spilled} cosmetic callbacks spilled over {self.spill_frames} frames"
+
 
 @dataclass
 class Timer:
@@ -13,48 +76,192 @@ class Timer:
     callback: FunctionType
     repeating: float = 0
     clear: bool = False
+    group: Optional[Hashable] = None
+    created: float = 0
+    catchup: str = SKIP
+    max_burst: int = 4
+    priority: int = CRITICAL
+    # Put off by the budget and counted as a spill, but not run since.
+    spilled: bool = False
 
     def __hash__(self):
         return hash(id(self))
 
 
 class Timers(System):
-    timers = set()
+    """Scheduler for delayed and repeating callbacks.
+
+    Timers live in a heap ordered by end time, so each step only looks at
+    the timers that are due. Cancelling just marks the timer; it is thrown
+    away when it reaches the front of the queue.
+
+    Every timer belongs to a group: an entity, SESSION, or anything else
+    hashable. Timers created without one go in the None group.
+    cancel_group() drops a whole group at once and report() lists what is
+    still alive, which makes timers leaking across restarts easy to spot.
+
+    A repeating timer that falls behind, after a slow frame for example,
+    catches up according to its policy (SKIP, COALESCE or BURST) and is
+    then rescheduled past the current time.
+
+    Timers run in the clock's fixed steps. COSMETIC timers only run while
+    the frame's budget lasts, however many steps the frame runs. The rest
+    stay at the front of the queue for a later step; the budget counts the
+    spills.
+    """
+
+    queue = []
+    groups = defaultdict(set)
+    budget = FrameBudget()
+    _order = count()
 
     @classmethod
-    def delay(cls, seconds, func):
-        t = Timer(monotonic() + seconds, func)
-        cls.timers.add(t)
+    def _push(cls, t):
+        heappush(cls.queue, (t.end_time, next(cls._order), t))
         return t
-    
+
     @classmethod
-    def repeat(cls, seconds, func):
-        t = Timer(monotonic() + seconds, func, repeating=seconds)
-        cls.timers.add(t)
-        return t
-    
+    def _add(cls, t):
+        t.created = clock_now()
+        cls.groups[t.group].add(t)
+        return cls._push(t)
+
+    @classmethod
+    def _discard(cls, t):
+        timers = cls.groups.get(t.group)
+        if timers is not None:
+            timers.discard(t)
+            if not timers:
+                del cls.groups[t.group]
+
+    @classmethod
+    def delay(cls, seconds, func, group=None, priority=CRITICAL):
+        return cls._add(Timer(clock_now() + seconds, func, group=group, priority=priority))
+
+    @classmethod
+    def repeat(cls, seconds, func, group=None, catchup=SKIP, max_burst=4, priority=CRITICAL):
+        if catchup not in CATCHUP_POLICIES:
+            raise ValueError(f"Catch-up policy must be one of {CATCHUP_POLICIES}, not '{catchup}'.")
+        return cls._add(Timer(
+            clock_now() + seconds, func,
+            repeating=seconds, group=group,
+            catchup=catchup, max_burst=max_burst, priority=priority,
+        ))
+
     @classmethod
     def cancel(cls, timer):
         timer.clear = True
+        cls._discard(timer)
+
+    @classmethod
+    def cancel_group(cls, group):
+        """Cancel every live timer in a group, returning how many there were."""
+        timers = cls.groups.pop(group, ())
+        for t in timers:
+            t.clear = True
+        return len(timers)
+
+    @classmethod
+    def live(cls):
+        return sum(len(timers) for timers in cls.groups.values())
+
+    @classmethod
+    def report(cls, min_age=10.0):
+        """Describe live timers, listing those older than min_age by group."""
+        now = clock_now()
+        old = defaultdict(list)
+        for group, timers in cls.groups.items():
+            for t in timers:
+                if now - t.created >= min_age:
+                    old[group].append(t)
+        lines = [
+            f"{cls.live()} live timers in {len(cls.groups)} groups, "
+            f"{sum(map(len, old.values()))} older than {min_age}s, "
+            f"{len(cls.queue)} queued, {cls.budget}"
+        ]
+        for group, timers in sorted(old.items(), key=lambda item: -len(item[1])):
+            lines.append(f"  {group!r}: {len(timers)} of {len(cls.groups[group])}")
+            for t in sorted(timers, key=lambda t: t.created):
+                kind = f"every {t.repeating}s" if t.repeating else "once"
+                lines.append(f"    {t.callback!r} {kind}, age {now - t.created:.1f}s")
+        return "\n".join(lines)
+
+    @classmethod
+    def next_due(cls):
+        queue = cls.queue
+        while queue and queue[0][2].clear:
+            heappop(queue)
+        return queue[0][0] if queue else None
 
     @classmethod
     def on_idle(cls, idle, signal):
-        clear = []
-        for t in list(cls.timers):
-            if t.clear:
-                clear.append(t)
-            else:
-                now = monotonic()
-                if now >= t.end_time:
-                    t.callback()
-                    if t.repeating > 0:
-                        t.end_time += t.repeating
-                    else:
-                        clear.append(t)
-        for t in clear:
-            cls.timers.remove(t)
+        # Once a frame, before the frame's steps are handled.
+        cls.budget.start()
+
+    @classmethod
+    def on_update(cls, update, signal):
+        now = clock_now()
+        queue = cls.queue
+
+        # Pull everything due before running any callback, so timers
+        # scheduled by those callbacks wait for the next step.
+        due = []
+        cosmetic = []
+        while queue and queue[0][0] <= now:
+            t = heappop(queue)[2]
+            if not t.clear:
+                (cosmetic if t.priority == COSMETIC else due).append(t)
+
+        for t in due:
+            cls._run(t, now)
+
+        budget = cls.budget
+        for i, t in enumerate(cosmetic):
+            if not budget.allows():
+                for t in cosmetic[i:]:
+                    if not t.clear:
+                        # Count each callback once, however many steps it waits.
+                        if not t.spilled:
+                            t.spilled = True
+                            budget.spill()
+                        cls._push(t)
+                break
+            t.spilled = False
+            cls._run(t, now)
+            budget.spend()
+
+    @classmethod
+    def _run(cls, t, now):
+        if t.clear:
+            return
+        if t.repeating > 0:
+            cls._fire_repeating(t, now)
+            if not t.clear:
+                cls._push(t)
+        else:
+            t.callback()
+            cls._discard(t)
+
+    @classmethod
+    def _fire_repeating(cls, t, now):
+        missed = floor((now - t.end_time) / t.repeating)
+        # Move past now in one step, so a hitch never leaves a backlog.
+        t.end_time += (missed + 1) * t.repeating
+
+        if t.catchup == COALESCE:
+            t.callback(missed)
+        elif t.catchup == BURST:
+            for _ in range(min(missed + 1, t.max_burst)):
+                t.callback()
+                if t.clear:
+                    break
+        else:
+            t.callback()
 
 
 delay = Timers.delay
 repeat = Timers.repeat
 cancel = Timers.cancel
+cancel_group = Timers.cancel_group
+
+watch(Timers.next_due)
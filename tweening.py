@@ -1,40 +1,51 @@
 from dataclasses import dataclass
-from time import monotonic
+from heapq import heapify, heappop, heappush
+from itertools import count
 
+import numpy as np
 import ppb
 from ppb.systemslib import System
 
 import easing
+from clock import now as clock_now, watch
 
-def ilerp(f1, f2, t):
-    return int(f1 + t * (f2 - f1))
+def interpolator(a, b):
+    """Return f(t) interpolating from a to b, specialised for a's type.
 
-def flerp(f1, f2, t):
-    return f1 + t * (f2 - f1)
-
-def vlerp(v1, v2, t):
-    return ppb.Vector(
-        v1.x + t * (v2.x - v1.x),
-        v1.y + t * (v2.y - v1.y),
-    )
-
-def tlerp(t1, t2, t):
-    assert len(t1) == len(t2)
-    return tuple(
-        lerp(i1, i2, t)
-        for (i1, i2) in zip(t1, t2)
-    )
-
-def lerp(a, b, t):
+    The type checks and unpacking happen once here instead of on every
+    call, and f(t) only allocates the value it returns. Clips use it for
+    TOWARD tracks; tweens in a TweenTable are interpolated as rows and
+    written back with writer() instead.
+    """
     if isinstance(a, tuple):
-        value = tlerp(a, b, t)
+        if len(a) == 3 and all(isinstance(v, int) for v in a):
+            r, g, b_ = a
+            dr, dg, db = b[0] - r, b[1] - g, b[2] - b_
+            return lambda t: (int(r + t * dr), int(g + t * dg), int(b_ + t * db))
+        parts = tuple(interpolator(i1, i2) for (i1, i2) in zip(a, b))
+        return lambda t: tuple(f(t) for f in parts)
     elif isinstance(a, ppb.Vector):
-        value = vlerp(a, b, t)
+        Vector = ppb.Vector
+        x, y = a.x, a.y
+        dx, dy = b.x - x, b.y - y
+        return lambda t: Vector(x + t * dx, y + t * dy)
     elif isinstance(a, int):
-        value = ilerp(a, b, t)
+        d = b - a
+        return lambda t: int(a + t * d)
     else:
-        value = flerp(a, b, t)
-    return value
+        d = b - a
+        return lambda t: a + t * d
+
+
+# What to do when a tween meets others on the same attribute of the same
+# object:
+#   OVERWRITE  when it starts, drop the others (but not ADDITIVE ones)
+#   QUEUE      start only once the others have finished
+#   ADDITIVE   end value is an offset, layered on whatever else is running
+OVERWRITE = 'overwrite'
+QUEUE = 'queue'
+ADDITIVE = 'additive'
+CONFLICT_POLICIES = (OVERWRITE, QUEUE, ADDITIVE)
 
 
 @dataclass
@@ -46,82 +57,495 @@ class Tween:
     start_value: object
     end_value: object
     easing: str = "linear"
+    easing_id: int = 0
+    conflict: str = OVERWRITE
+
+    @property
+    def key(self):
+        return (id(self.obj), self.attr)
+
+
+# Widest value a tween row can hold: an RGBA colour.
+MAX_COMPONENTS = 4
+
+def components(value):
+    """Flatten a tweenable value into a tuple of floats."""
+    if isinstance(value, tuple):
+        return value
+    elif isinstance(value, ppb.Vector):
+        return (value.x, value.y)
+    else:
+        return (value,)
+
+def writer(value):
+    """Pick the function that rebuilds value's type from row i of columns.
+
+    Chosen once per tween, when its start value is captured. The columns
+    are lists of floats, one per component, so building a value allocates
+    nothing but the value itself.
+    """
+    if isinstance(value, tuple):
+        if len(value) == 3 and all(isinstance(v, int) for v in value):
+            return lambda cols, i: (int(cols[0][i]), int(cols[1][i]), int(cols[2][i]))
+        types = tuple(int if isinstance(v, int) else float for v in value)
+        return lambda cols, i: tuple(t(col[i]) for t, col in zip(types, cols))
+    elif isinstance(value, ppb.Vector):
+        Vector = ppb.Vector
+        return lambda cols, i: Vector(cols[0][i], cols[1][i])
+    elif isinstance(value, int):
+        return lambda cols, i: int(cols[0][i])
+    else:
+        return lambda cols, i: cols[0][i]
+
+def build(write, row):
+    """Use a writer on a single row of floats."""
+    return write([[v] for v in row], 0)
+
+
+class TweenTable:
+    """Running tweens stored as rows of NumPy arrays.
+
+    Each row holds the start and end value (flattened to floats), start
+    time, duration and easing of one tween. step() advances every row in a
+    single batched pass and then compacts the finished rows away.
+
+    ADDITIVE rows tween from zero to their offset. Each frame their change
+    is added to the attribute. While an absolute row runs on the same
+    attribute, the changes are collected in a per-attribute offset that the
+    absolute row adds to every value it writes.
+
+    nudge() queues the same kind of change from outside the table, such as
+    an OFFSET clip track, to be applied by the next step().
+    """
+
+    _arrays = ('start', 'end', 'start_time', 'duration', 'easing', 'additive')
+    _lists = ('objs', 'attrs', 'keys', 'groups', 'end_values', 'writers', 'applied')
+
+    def __init__(self, capacity=64):
+        self.n = 0
+        self.width = 1
+        self.start = np.zeros((capacity, MAX_COMPONENTS))
+        self.end = np.zeros((capacity, MAX_COMPONENTS))
+        self.start_time = np.zeros(capacity)
+        self.duration = np.zeros(capacity)
+        self.easing = np.zeros(capacity, dtype=np.intp)
+        self.additive = np.zeros(capacity, dtype=bool)
+        self.objs = []
+        self.attrs = []
+        self.keys = []
+        self.groups = []
+        self.end_values = []
+        self.writers = []
+        self.applied = []
+        self.key_counts = {}
+        self.group_counts = {}
+        # Rows per animated object, by id().
+        self.obj_counts = {}
+        self.offsets = {}
+        self.nudges = []
+
+    def __len__(self):
+        return self.n
+
+    def _grow(self):
+        capacity = 2 * len(self.start_time)
+        for name in self._arrays:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def end_time(self, key):
+        """The latest end time of the running tweens on key, or None."""
+        if not self.key_counts.get(key):
+            return None
+        return max(
+            self.start_time[i] + self.duration[i]
+            for i, k in enumerate(self.keys) if k == key
+        )
+
+    def add(self, tween, group=None):
+        if tween.conflict == OVERWRITE:
+            self.supersede(tween.key)
+        if self.n == len(self.start_time):
+            self._grow()
+
+        i = self.n
+        additive = tween.conflict == ADDITIVE
+        end = components(tween.end_value)
+        start = (0.0,) * len(end) if additive else components(tween.start_value)
+        self.start[i, :len(start)] = start
+        self.end[i, :len(end)] = end
+        self.start_time[i] = tween.start_time
+        self.duration[i] = tween.end_time - tween.start_time
+        self.easing[i] = tween.easing_id
+        self.additive[i] = additive
+        self.objs.append(tween.obj)
+        self.attrs.append(tween.attr)
+        self.keys.append(tween.key)
+        self.groups.append(group)
+        self.end_values.append(tween.end_value)
+        self.writers.append(writer(tween.start_value))
+        self.width = max(self.width, len(end))
+        self.applied.append(start)
+        self.key_counts[tween.key] = self.key_counts.get(tween.key, 0) + 1
+        self.group_counts[group] = self.group_counts.get(group, 0) + 1
+        self.obj_counts[id(tween.obj)] = self.obj_counts.get(id(tween.obj), 0) + 1
+        if not additive:
+            # The start value already includes earlier offsets.
+            self.offsets.pop(tween.key, None)
+        self.n += 1
+
+    def supersede(self, key):
+        """Drop the absolute rows animating key."""
+        if self.key_counts.get(key):
+            self.remove(lambda i: self.keys[i] == key and not self.additive[i])
+
+    def nudge(self, obj, attr, key, write, change):
+        """Add change to obj.attr on the next step, like an additive row."""
+        self.nudges.append((obj, attr, key, write, change))
+
+    def remove(self, predicate):
+        keep = [i for i in range(self.n) if not predicate(i)]
+        if len(keep) < self.n:
+            self._compact(np.array(keep, dtype=np.intp))
+
+    def step(self, now):
+        n = self.n
+        # Always a fresh list: additive rows append to changes below.
+        changes, self.nudges = self.nudges, []
+        if not n:
+            self._apply(changes, ())
+            return
+
+        duration = self.duration[:n]
+        elapsed = now - self.start_time[:n]
+        tr = np.divide(elapsed, duration, out=np.ones(n), where=duration > 0)
+        np.clip(tr, 0.0, 1.0, out=tr)
+
+        eased = np.empty(n)
+        ids = self.easing[:n]
+        for eid in np.unique(ids):
+            mask = ids == eid
+            eased[mask] = easing.EASINGS[eid].evaluate(tr[mask])
+
+        width = self.width
+        start = self.start[:n, :width]
+        cols = (start + eased[:, None] * (self.end[:n, :width] - start)).T.tolist()
+        done = tr >= 1.0
+        additive = self.additive[:n]
+
+        objs, attrs, keys, writers = self.objs, self.attrs, self.keys, self.writers
+        offsets = self.offsets
+
+        if additive.any():
+            for i in np.flatnonzero(additive).tolist():
+                row = [col[i] for col in cols[:len(self.applied[i])]]
+                change = [v - a for v, a in zip(row, self.applied[i])]
+                self.applied[i] = row
+                changes.append((objs[i], attrs[i], keys[i], writers[i], change))
+
+        key_counts = self.key_counts
+        for _, _, key, _, change in changes:
+            if key in key_counts:
+                offset = offsets.get(key)
+                offsets[key] = change if offset is None else [o + c for o, c in zip(offset, change)]
+
+        written = set()
+        for i, finished in enumerate(done.tolist()):
+            if additive[i]:
+                continue
+            offset = offsets.get(keys[i])
+            if offset is None:
+                value = self.end_values[i] if finished else writers[i](cols, i)
+            else:
+                value = build(writers[i], [col[i] + o for col, o in zip(cols, offset)])
+            setattr(objs[i], attrs[i], value)
+            written.add(keys[i])
+
+        self._apply(changes, written)
+
+        if done.any():
+            self._compact(np.flatnonzero(~done))
+
+    @staticmethod
+    def _apply(changes, written):
+        """Add changes to attributes no absolute row wrote this step."""
+        for obj, attr, key, write, change in changes:
+            if key not in written:
+                current = components(getattr(obj, attr))
+                setattr(obj, attr, build(write, [c + d for c, d in zip(current, change)]))
+
+    def _compact(self, keep):
+        k = len(keep)
+        for name in self._arrays:
+            array = getattr(self, name)
+            array[:k] = array[keep]
+        idx = keep.tolist()
+        for name in self._lists:
+            items = getattr(self, name)
+            setattr(self, name, [items[i] for i in idx])
+        counts = {}
+        for key in self.keys:
+            counts[key] = counts.get(key, 0) + 1
+        self.key_counts = counts
+        group_counts = {}
+        for group in self.groups:
+            group_counts[group] = group_counts.get(group, 0) + 1
+        self.group_counts = group_counts
+        obj_counts = {}
+        for obj in self.objs:
+            obj_counts[id(obj)] = obj_counts.get(id(obj), 0) + 1
+        self.obj_counts = obj_counts
+        self.offsets = {key: o for key, o in self.offsets.items() if key in counts}
+        self.n = k
 
 
 class Tweener:
-    """A controller of object transitions over time.
-    
-    A Tweener has to be added to a scene in order to work! After creating it,
-    make multiple calls to tween() to set transitions of object members over
-    time. Callbacks may be added to the Tweener with when_done() and all
-    callbacks will be invoked when the final transition ends.
+    """A group of object transitions over time.
+
+    After creating a Tweener, make multiple calls to tween() to set
+    transitions of object members over time. Callbacks may be added to the
+    Tweener with when_done() and all callbacks will be invoked when the
+    final transition ends.
+
+    A Tweener is only a handle: the TweenScheduler system owns and runs the
+    tweens of every Tweener, so a Tweener with nothing to do costs nothing
+    and does not need to be added to the scene.
+
+    Tweens on the same attribute of the same object follow their conflict
+    policy, OVERWRITE by default: a tween starting replaces any still
+    running, so two tweens never fight over a value.
 
     Example:
 
         t = Tweener()
         t.tween(bomb, 'position', v_target, 1.0)
         t.when_done(play_sound("BOOM"))
-    """
 
-    size = 0
+        # Lunge and recoil without drifting from where the sprite was
+        t.tween(hero, 'position', V(-1, 0), 0.1, conflict=ADDITIVE)
+        t.tween(hero, 'position', V(1, 0), 0.2, delay=0.1, conflict=ADDITIVE)
+    """
 
     def __init__(self, name=None):
         self.name = name or f"tweener-{id(self)}"
-        self.tweens = []
         self.callbacks = []
-        # self.used = False
-        # self.done = False
 
     def __hash__(self):
         return hash(id(self))
 
+    def __repr__(self):
+        return f"<Tweener {self.name}>"
+
     @property
     def is_tweening(self):
-        return bool(self.tweens)
+        return bool(TweenScheduler.active(self))
 
     def tween(self, entity, attr, end_value, duration, **kwargs):
+        TweenScheduler.tween(self, entity, attr, end_value, duration, **kwargs)
+
+    def play(self, clip, target, **kwargs):
+        """Play a pre-baked clip on target, as part of this Tweener."""
+        return TweenScheduler.play(self, clip, target, **kwargs)
+
+    def stop(self, entity, attr=None):
+        """Drop this Tweener's tweens on entity, or on one of its attributes."""
+        TweenScheduler.stop(entity, attr, group=self)
+    
+    def when_done(self, func):
+        self.callbacks.append(func)
+        TweenScheduler.watch(self)
+
+
+class TweenScheduler(System):
+    """Runs the tweens of every Tweener.
+
+    Tweens wait in a heap ordered by start time until their delay is over,
+    then move into one shared TweenTable that updates them together. After
+    each step, only Tweeners with when_done() callbacks are checked for
+    having finished; all other Tweeners are not touched at all.
+
+    Clips played through a Tweener count as part of it until they end.
+    """
+
+    pending = []
+    pending_counts = {}
+    # Pending tweens per object, by id().
+    pending_obj_counts = {}
+    table = TweenTable()
+    clips = []
+    clip_counts = {}
+    watching = set()
+    _order = count()
+
+    @classmethod
+    def active(cls, group):
+        return (
+            cls.pending_counts.get(group, 0)
+            + cls.table.group_counts.get(group, 0)
+            + cls.clip_counts.get(group, 0)
+        )
+
+    @classmethod
+    def counts(cls):
+        """Pending and running tweens and clips for each Tweener that has any."""
+        groups = set(cls.pending_counts) | set(cls.table.group_counts) | set(cls.clip_counts)
+        return {group: cls.active(group) for group in groups if cls.active(group)}
+
+    @classmethod
+    def report(cls):
+        counts = cls.counts()
+        lines = [
+            f"{len(cls.table)} running tweens, {len(cls.pending)} pending, "
+            f"{len(cls.clips)} clips, {len(counts)} active tweeners"
+        ]
+        for group, n in sorted(counts.items(), key=lambda item: -item[1]):
+            lines.append(f"  {getattr(group, 'name', group)}: {n}")
+        return "\n".join(lines)
+
+    @classmethod
+    def tween(cls, group, entity, attr, end_value, duration, **kwargs):
         assert entity
         delay = kwargs.pop('delay', 0)
-        self.used = True
-        start_time = monotonic() + delay
-        self.tweens.append(Tween(
+        conflict = kwargs.pop('conflict', OVERWRITE)
+        if conflict not in CONFLICT_POLICIES:
+            raise ValueError(f"Conflict policy must be one of {CONFLICT_POLICIES}, not '{conflict}'.")
+        start_time = clock_now() + delay
+        if conflict == QUEUE:
+            start_time = max(start_time, cls.end_time(entity, attr))
+        t = Tween(
             start_time=start_time,
             end_time=start_time + duration,
             obj=entity,
             attr=attr,
             start_value=None,
             end_value=end_value,
+            easing_id=easing.resolve(kwargs.get('easing', 'linear')),
+            conflict=conflict,
             **kwargs,
-        ))
-    
-    def when_done(self, func):
-        self.callbacks.append(func)
+        )
+        heappush(cls.pending, (start_time, next(cls._order), group, t))
+        cls.pending_counts[group] = cls.pending_counts.get(group, 0) + 1
+        cls.pending_obj_counts[id(entity)] = cls.pending_obj_counts.get(id(entity), 0) + 1
 
-    def on_idle(self, update, signal):
-        t = monotonic()
-        clear = []
+    @classmethod
+    def play(cls, group, clip, target, delay=0, duration=None, **targets):
+        """Start a clip on target after delay, optionally stretched to duration.
 
-        for i, tween in enumerate(self.tweens):
-            if tween.start_time > t:
-                continue
-            if tween.start_value is None:
-                tween.start_value = getattr(tween.obj, tween.attr)
-            tr = (t - tween.start_time) / (tween.end_time - tween.start_time)
-            tr = min(1.0, max(0.0, tr))
-            tr = getattr(easing, tween.easing)(tr)
-            value = lerp(tween.start_value, tween.end_value, tr)
-            setattr(tween.obj, tween.attr, value)
-            if tr >= 1.0:
-                clear.append(i)
-
-        for i in reversed(clear):
-            del self.tweens[i]
-        
-        if not self.is_tweening:
-            callbacks = self.callbacks[:]
-            self.callbacks.clear()
-            for func in callbacks:
-                func()
+        Keyword arguments name the targets of the clip's TOWARD tracks.
+        """
+        assert target
+        instance = clip.instance(target, clock_now() + delay, duration, targets, group)
+        cls.clips.append(instance)
+        cls.clip_counts[group] = cls.clip_counts.get(group, 0) + 1
+        return instance
+
+    @classmethod
+    def end_time(cls, entity, attr):
+        """When the last tween on entity.attr ends, or now if there is none."""
+        key = (id(entity), attr)
+        ends = [t.end_time for _, _, _, t in cls.pending if t.key == key]
+        running = cls.table.end_time(key)
+        if running is not None:
+            ends.append(running)
+        return max(ends, default=clock_now())
+
+    @classmethod
+    def stop(cls, entity, attr=None, group=None):
+        """Drop the tweens on entity, or on one of its attributes.
+
+        With a group, only that Tweener's tweens are dropped. The pending
+        heap and the table are only searched if entity has tweens in them,
+        so stopping an entity with nothing running, like a pooled particle
+        about to be reused, costs two lookups.
+        """
+        def matches(obj, name, owner):
+            return (
+                obj is entity
+                and (attr is None or name == attr)
+                and (group is None or owner is group)
+            )
+
+        if cls.pending_obj_counts.get(id(entity)):
+            kept = [entry for entry in cls.pending if not matches(entry[3].obj, entry[3].attr, entry[2])]
+            if len(kept) < len(cls.pending):
+                heapify(kept)
+                cls.pending = kept
+                counts = {}
+                obj_counts = {}
+                for entry in kept:
+                    counts[entry[2]] = counts.get(entry[2], 0) + 1
+                    obj_counts[id(entry[3].obj)] = obj_counts.get(id(entry[3].obj), 0) + 1
+                cls.pending_counts = counts
+                cls.pending_obj_counts = obj_counts
+
+        table = cls.table
+        if table.obj_counts.get(id(entity)):
+            table.remove(lambda i: matches(table.objs[i], table.attrs[i], table.groups[i]))
+
+        for instance in cls.clips:
+            if instance.target is entity and (group is None or instance.group is group):
+                if attr is None or any(track.attr == attr for track in instance.clip.tracks):
+                    instance.stop()
+
+    @classmethod
+    def _step_clips(cls, t):
+        # Clips go first: their offsets are picked up by this frame's step.
+        running = []
+        for instance in cls.clips:
+            instance.step(t, cls.table)
+            if not instance.done:
+                running.append(instance)
+            else:
+                group = instance.group
+                cls.clip_counts[group] -= 1
+                if not cls.clip_counts[group]:
+                    del cls.clip_counts[group]
+        cls.clips = running
+
+    @classmethod
+    def watch(cls, group):
+        cls.watching.add(group)
+
+    @classmethod
+    def next_due(cls):
+        if len(cls.table):
+            return clock_now()
+        starts = [instance.start_time for instance in cls.clips]
+        if cls.pending:
+            starts.append(cls.pending[0][0])
+        return min(starts, default=None)
+
+    @classmethod
+    def on_update(cls, update, signal):
+        t = clock_now()
+
+        pending = cls.pending
+        while pending and pending[0][0] <= t:
+            _, _, group, tween = heappop(pending)
+            cls.pending_counts[group] -= 1
+            if not cls.pending_counts[group]:
+                del cls.pending_counts[group]
+            cls.pending_obj_counts[id(tween.obj)] -= 1
+            if not cls.pending_obj_counts[id(tween.obj)]:
+                del cls.pending_obj_counts[id(tween.obj)]
+            tween.start_value = getattr(tween.obj, tween.attr)
+            cls.table.add(tween, group)
+
+        if cls.clips:
+            cls._step_clips(t)
+
+        cls.table.step(t)
+
+        if cls.watching:
+            finished = [group for group in cls.watching if not cls.active(group)]
+            for group in finished:
+                cls.watching.discard(group)
+                callbacks = group.callbacks[:]
+                group.callbacks.clear()
+                for func in callbacks:
+                    func()
 
 
 class TweenSystem(System):
@@ -131,9 +555,14 @@ class TweenSystem(System):
     @classmethod
     def on_scene_started(cls, ev, signal):
         cls.scene = ev.scene
-        cls.current_tweener = Tweener()
-        cls.scene.add(cls.current_tweener)
+        cls.current_tweener = Tweener('main')
     
 
+watch(TweenScheduler.next_due)
+
+
 def tween(*args, **kwargs):
     TweenSystem.current_tweener.tween(*args, **kwargs)
+
+def play(*args, **kwargs):
+    return TweenSystem.current_tweener.play(*args, **kwargs)